@@ -0,0 +1,269 @@
+"""In-process stand-in for the RAGFlow HTTP API used by ragflow_sdk.
+
+Implements just the endpoints this app calls (chats, sessions, streaming
+completions, retrieval, datasets, documents and chunks) with configurable
+latency and token rates, so performance can be measured without the
+production RAGFlow box.
+
+Run standalone with `python -m benchmarks.fake_ragflow --port 9380`.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+WORDS = (
+    "grassland dairy nitrogen soil carbon emissions beef sheep tillage barley wheat slurry yield "
+    "grazing herd fertiliser biodiversity hedgerow forestry Teagasc Ireland trial farm sward clover"
+).split()
+
+
+@dataclass
+class FakeConfig:
+    agent_name: str = "Bench Assistant"
+    dataset_name: str = "bench"
+    documents: int = 2000
+    chunks_per_document: int = 40
+    chunk_words: int = 120
+    latency: float = 0.02          # Seconds added to every request.
+    ttft: float = 0.3              # Seconds before the first answer token.
+    token_rate: float = 50.0       # Answer tokens streamed per second.
+    answer_tokens: int = 150
+    tokens_per_message: int = 4    # Tokens per streamed SSE message.
+
+
+class FakeRAGFlow:
+    """The data behind the fake server: one chat, one dataset, synthetic papers."""
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.chat = {"id": "chat-bench", "name": config.agent_name}
+        self.dataset = {"id": "dataset-bench", "name": config.dataset_name}
+        self.documents = [
+            {
+                "id": f"doc-{i:06d}",
+                "name": f"paper-{i:06d}.pdf",
+                "dataset_id": self.dataset["id"],
+                "chunk_count": config.chunks_per_document,
+                "token_count": config.chunks_per_document * config.chunk_words,
+                "process_begin_at": "2025-01-01 00:00:00",
+                "run": "DONE",
+            }
+            for i in range(config.documents)
+        ]
+        self._by_id = {doc["id"]: doc for doc in self.documents}
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.asks: List[Tuple[str, str]] = []   # (session id, question) of every completion request.
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def chunk(self, doc: Dict[str, Any], position: int, similarity: Optional[float] = None) -> Dict[str, Any]:
+        rng = random.Random(f"{doc['id']}:{position}")
+        content = " ".join(rng.choice(WORDS) for _ in range(self.config.chunk_words))
+        chunk = {
+            "id": f"{doc['id']}-c{position:05d}",
+            "content": content,
+            "document_id": doc["id"],
+            "document_name": doc["name"],
+            "document_keyword": doc["name"],
+            "dataset_id": self.dataset["id"],
+            "positions": [[position]],
+            "available": True,
+        }
+        if similarity is not None:
+            chunk.update(similarity=similarity, vector_similarity=similarity, term_similarity=similarity)
+        return chunk
+
+    def list_chunks(self, doc_id: str, page: int, page_size: int) -> List[Dict[str, Any]]:
+        doc = self._by_id[doc_id]
+        start = (page - 1) * page_size
+        stop = min(doc["chunk_count"], start + page_size)
+        return [self.chunk(doc, position) for position in range(start, stop)]
+
+    def retrieve(self, question: str, page_size: int) -> List[Dict[str, Any]]:
+        rng = random.Random(question)
+        docs = rng.sample(self.documents, min(page_size, len(self.documents)))
+        return [
+            self.chunk(doc, rng.randrange(doc["chunk_count"]), similarity=round(1 - i / (2 * page_size), 4))
+            for i, doc in enumerate(docs)
+        ]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake: FakeRAGFlow = None  # Set on the per-server subclass.
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _send(self, payload: Any, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self) -> Tuple[str, Dict[str, List[str]]]:
+        url = urlparse(self.path)
+        return url.path.removeprefix("/api/v1"), parse_qs(url.query)
+
+    def do_GET(self):
+        time.sleep(self.fake.config.latency)
+        path, query = self._route()
+        page = int(query.get("page", ["1"])[0])
+        page_size = int(query.get("page_size", ["30"])[0])
+        fake = self.fake
+        if path == "/chats":
+            fake.count("list_chats")
+            return self._send({"code": 0, "data": [fake.chat]})
+        if path == "/datasets":
+            fake.count("list_datasets")
+            return self._send({"code": 0, "data": [fake.dataset]})
+        match = re.fullmatch(r"/datasets/[^/]+/documents", path)
+        if match:
+            fake.count("list_documents")
+            if "id" in query:
+                docs = [doc for doc in fake.documents if doc["id"] == query["id"][0]]
+            else:
+                docs = fake.documents[(page - 1) * page_size:page * page_size]
+            return self._send({"code": 0, "data": {"docs": docs, "total": len(fake.documents)}})
+        match = re.fullmatch(r"/datasets/[^/]+/documents/([^/]+)/chunks", path)
+        if match:
+            fake.count("list_chunks")
+            chunks = fake.list_chunks(match.group(1), page, page_size)
+            return self._send({"code": 0, "data": {"chunks": chunks, "total": len(chunks)}})
+        self._send({"code": 404, "message": f"Unknown path {path}"}, status=404)
+
+    def do_POST(self):
+        time.sleep(self.fake.config.latency)
+        path, _ = self._route()
+        body = self._body()
+        fake = self.fake
+        if path == "/datasets":
+            fake.count("create_dataset")
+            return self._send({"code": 102, "message": "Duplicated dataset name in creating dataset."})
+        if path == "/retrieval":
+            fake.count("retrieve")
+            chunks = fake.retrieve(body.get("question", ""), int(body.get("page_size", 30)))
+            return self._send({"code": 0, "data": {"chunks": chunks, "doc_aggs": [], "total": len(chunks)}})
+        match = re.fullmatch(r"/chats/([^/]+)/sessions", path)
+        if match:
+            fake.count("create_session")
+            session = {"id": uuid.uuid4().hex, "name": body.get("name", "New session"),
+                       "chat_id": match.group(1), "messages": []}
+            with fake.lock:
+                fake.sessions[session["id"]] = session
+            return self._send({"code": 0, "data": session})
+        match = re.fullmatch(r"/chats/([^/]+)/completions", path)
+        if match:
+            fake.count("ask")
+            with fake.lock:
+                fake.asks.append((body.get("session_id"), body.get("question", "")))
+                session = fake.sessions.get(body.get("session_id"))
+                if session is not None:
+                    session["messages"].append({"role": "user", "content": body.get("question", "")})
+            return self._stream_answer(body)
+        self._send({"code": 404, "message": f"Unknown path {path}"}, status=404)
+
+    def do_DELETE(self):
+        time.sleep(self.fake.config.latency)
+        path, _ = self._route()
+        body = self._body()
+        if re.fullmatch(r"/chats/[^/]+/sessions", path):
+            self.fake.count("delete_sessions")
+            with self.fake.lock:
+                for session_id in body.get("ids") or []:
+                    self.fake.sessions.pop(session_id, None)
+            return self._send({"code": 0})
+        self._send({"code": 404, "message": f"Unknown path {path}"}, status=404)
+
+    def _stream_answer(self, body: Dict[str, Any]):
+        """Server-sent events with a cumulative answer, as RAGFlow streams it."""
+        config = self.fake.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        rng = random.Random(body.get("question", ""))
+        references = self.fake.retrieve(body.get("question", ""), 5)
+        time.sleep(config.ttft)
+        answer = ""
+        interval = config.tokens_per_message / config.token_rate
+        try:
+            for emitted in range(0, config.answer_tokens, config.tokens_per_message):
+                words = [rng.choice(WORDS) for _ in range(min(config.tokens_per_message, config.answer_tokens - emitted))]
+                answer += " ".join(words) + " "
+                if emitted and emitted % 40 == 0:
+                    answer += f"##{emitted // 40}$$ "
+                data = {"answer": answer, "reference": {"chunks": references}, "id": uuid.uuid4().hex,
+                        "session_id": body.get("session_id")}
+                self.wfile.write(f"data:{json.dumps({'code': 0, 'data': data})}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(interval)
+            self.wfile.write(b'data:{"code": 0, "data": true}\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client stopped reading (e.g. a cancelled answer).
+
+
+def start_server(config: FakeConfig, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, FakeRAGFlow]:
+    """Serve a FakeRAGFlow on a daemon thread; port 0 picks a free port."""
+    fake = FakeRAGFlow(config)
+    handler = type("BoundHandler", (Handler,), {"fake": fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ragflow", daemon=True).start()
+    return server, fake
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = FakeConfig()
+    parser.add_argument("--documents", type=int, default=defaults.documents)
+    parser.add_argument("--chunks-per-document", type=int, default=defaults.chunks_per_document)
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="Seconds per request.")
+    parser.add_argument("--ttft", type=float, default=defaults.ttft, help="Seconds to first answer token.")
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate, help="Answer tokens per second.")
+    parser.add_argument("--answer-tokens", type=int, default=defaults.answer_tokens)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        documents=args.documents,
+        chunks_per_document=args.chunks_per_document,
+        latency=args.latency,
+        ttft=args.ttft,
+        token_rate=args.token_rate,
+        answer_tokens=args.answer_tokens,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9380)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, _ = start_server(config_from_args(args), args.host, args.port)
+    print(f"Fake RAGFlow listening on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,162 @@
+"""Load benchmark for the question pipeline against a fake RAGFlow server.
+
+Starts benchmarks.fake_ragflow in-process, points the app at it and drives
+State.process_question and State.select_document for N concurrent simulated
+users, then reports time-to-first-token, tokens/sec, end-to-end latency
+percentiles and the state delta bytes each event would push to the browser.
+
+    python -m benchmarks.run --users 20 --questions 3 --ttft 0.3 --token-rate 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.fake_ragflow import add_arguments, config_from_args, start_server
+from chat.headless import new_state, run_background
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(name: str, values: List[float], unit: str = "ms", scale: float = 1000.0) -> str:
+    if not values:
+        return f"{name:<24} n=0"
+    scaled = [value * scale for value in values]
+    return (
+        f"{name:<24} n={len(values):<5} mean={statistics.fmean(scaled):9.1f}{unit}"
+        f"  p50={percentile(scaled, 50):9.1f}{unit}  p95={percentile(scaled, 95):9.1f}{unit}"
+        f"  p99={percentile(scaled, 99):9.1f}{unit}"
+    )
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    def add(self, name: str, value: float):
+        self.samples.setdefault(name, []).append(value)
+
+
+def delta_bytes(state) -> int:
+    """Bytes of the delta the backend would send for the current dirty vars, then mark clean."""
+    try:
+        from reflex.utils.format import json_dumps
+    except ImportError:
+        json_dumps = lambda value: json.dumps(value, default=str)
+    size = len(json_dumps(state.get_delta()).encode("utf-8"))
+    state._clean()
+    return size
+
+
+async def simulate_user(state_module, user: int, args, recorder: Recorder):
+    state = new_state(state_module.State, f"bench-user-{user}")
+    delta_bytes(state)
+    for n in range(args.questions):
+        question = f"What does Teagasc research say about topic {user % args.distinct_questions} ({n})?"
+        start = time.perf_counter()
+        first_token = None
+        events = 0
+
+        def on_update():
+            nonlocal events, first_token
+            events += 1
+            recorder.add("state_bytes_per_event", delta_bytes(state))
+            if first_token is None and state.streaming_answer:
+                first_token = time.perf_counter()
+
+        await run_background(state, state_module.State.process_question, {"question": question}, on_update=on_update)
+        end = time.perf_counter()
+        recorder.add("state_bytes_per_event", delta_bytes(state))
+        recorder.add("end_to_end", end - start)
+        recorder.add("events_per_answer", events)
+        if first_token is not None:
+            recorder.add("time_to_first_token", first_token - start)
+            if end > first_token:
+                recorder.add("tokens_per_second", args.answer_tokens / (end - first_token))
+
+        if args.select_every and n % args.select_every == 0:
+            documents = state_module.document_catalog.documents()
+            doc = documents[(user * 7 + n) % len(documents)]
+            start = time.perf_counter()
+            await state.select_document(doc)
+            recorder.add("select_document", time.perf_counter() - start)
+            recorder.add("select_document_bytes", delta_bytes(state))
+            state.clear_selected_document()
+            delta_bytes(state)
+
+
+async def main_async(args, state_module, fake) -> Recorder:
+    recorder = Recorder()
+    deadline = time.monotonic() + 60
+    while state_module.document_catalog.records() is None:
+        if time.monotonic() > deadline:
+            raise RuntimeError("The document catalog never loaded from the fake server.")
+        await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_user(state_module, user, args, recorder) for user in range(args.users)))
+    recorder.add("wall_clock", time.perf_counter() - started)
+    return recorder
+
+
+def report(recorder: Recorder, fake, args):
+    samples = recorder.samples
+    print(f"\n{args.users} users x {args.questions} questions "
+          f"(ttft={args.ttft}s, {args.token_rate} tok/s, {args.answer_tokens} tokens, latency={args.latency}s)")
+    print(summarize("time_to_first_token", samples.get("time_to_first_token", [])))
+    print(summarize("end_to_end", samples.get("end_to_end", [])))
+    print(summarize("tokens_per_second", samples.get("tokens_per_second", []), unit="", scale=1.0))
+    print(summarize("select_document", samples.get("select_document", [])))
+    print(summarize("state_bytes_per_event", samples.get("state_bytes_per_event", []), unit="B", scale=1.0))
+    print(summarize("select_document_bytes", samples.get("select_document_bytes", []), unit="B", scale=1.0))
+    print(summarize("events_per_answer", samples.get("events_per_answer", []), unit="", scale=1.0))
+    print(f"{'wall_clock':<24} {samples['wall_clock'][0]:.2f}s")
+    print(f"{'upstream_requests':<24} {json.dumps(dict(sorted(fake.requests.items())))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users.")
+    parser.add_argument("--questions", type=int, default=3, help="Questions per user.")
+    parser.add_argument("--distinct-questions", type=int, default=1000,
+                        help="Users share questions modulo this (lower = more repeats).")
+    parser.add_argument("--select-every", type=int, default=2,
+                        help="Select a document after every Nth question (0 = never).")
+    parser.add_argument("--json", help="Also write raw samples to this file.")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server, fake = start_server(config_from_args(args))
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    # Configuration is read at import time, so point the app at the fake server first.
+    os.environ.update(
+        RAGFLOW_API_KEY="bench",
+        RAGFLOW_BASE_URL=f"http://127.0.0.1:{server.server_port}",
+        AGENT_NAME=fake.config.agent_name,
+        ACRES_DATABASE=fake.config.dataset_name,
+        CHAT_HISTORY_DB=os.path.join(workdir, "chat_history.db"),
+        LOCAL_INDEX_DIR=os.path.join(workdir, "local_index"),
+    )
+    from chat import state as state_module
+
+    recorder = asyncio.run(main_async(args, state_module, fake))
+    report(recorder, fake, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(recorder.samples, f)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
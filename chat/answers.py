@@ -0,0 +1,154 @@
+"""Sharing of answers between clients asking the same question.
+
+Identical questions with the same context share one upstream generation while
+it is running, and the finished answer is replayed from a TTL cache until the
+context changes (the dataset or the selected document is re-parsed).
+
+A RAGFlow answer also depends on the earlier turns of the session it is asked
+in, so only a conversation's first question is shared. A client served from
+another session never has that turn in its own session; its follow-ups are
+asked there without it, and are not shared.
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from chat.cache import LRUCache
+from chat.metrics import metrics
+from chat.retrieval import normalize_question
+
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))       # Seconds; 0 disables the cache.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+
+
+def answer_key(question: str, context: Optional[Hashable]) -> Optional[Hashable]:
+    """Key for sharing an answer, or None when it must not be shared (pass a None context)."""
+    if context is None:
+        return None
+    return normalize_question(question), context
+
+
+class SharedGeneration:
+    """
+    One upstream answer stream with any number of subscribers. RAGFlow
+    messages carry the whole answer so far, so subscribers only ever need
+    the latest one.
+    """
+
+    def __init__(self, key: Optional[Hashable]):
+        self.key = key
+        self.message: Any = None
+        self.version = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.context_chunks: List[Dict[str, Any]] = []   # The chunks the answer was grounded on.
+        self.ticket = None                                # Admission ticket, once the producer has one.
+        self.shareable = key is not None                  # Cleared if the session turned out to have history.
+        self.subscribers = 0
+        self.cancel = asyncio.Event()                     # Set when the last subscriber leaves.
+        self._changed = asyncio.Event()
+
+    @property
+    def completed(self) -> bool:
+        return self.done and self.error is None and not self.cancel.is_set()
+
+    def publish(self, message: Any):
+        self.message = message
+        self.version += 1
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def updates(self, cancel: asyncio.Event, heartbeat: float):
+        """
+        Yield the latest message whenever it changes, or None every heartbeat
+        seconds without one, until the generation ends or cancel is set.
+        Re-raises the producer's error.
+        """
+        seen = 0
+        while True:
+            if self.version != seen:
+                seen = self.version
+                yield self.message
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            if cancel.is_set():
+                return
+            changed = asyncio.ensure_future(self._changed.wait())
+            cancelled = asyncio.ensure_future(cancel.wait())
+            done, _ = await asyncio.wait((changed, cancelled), timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+            changed.cancel()
+            cancelled.cancel()
+            if not done:
+                yield None
+
+
+class AnswerHub:
+    """In-flight generations by key, plus a TTL cache of finished answers. Use it from the event loop."""
+
+    def __init__(self, ttl: float = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_SIZE):
+        self._enabled = ttl > 0
+        self._inflight: Dict[Hashable, SharedGeneration] = {}
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl or None)
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+    def cached(self, key: Optional[Hashable]) -> Optional[Tuple[str, List[str]]]:
+        """The finished (answer, source links) for a key, if still fresh."""
+        if key is None or not self._enabled:
+            return None
+        return self._cache.get(key)
+
+    def store(self, key: Optional[Hashable], answer: str, sources: List[str]):
+        if key is None or not self._enabled:
+            return
+        size = len(json.dumps([answer, sources]).encode("utf-8"))
+        self._cache.set(key, (answer, list(sources)), size=size)
+
+    def join(self, key: Optional[Hashable], produce: Callable[[SharedGeneration], Awaitable[None]]) -> SharedGeneration:
+        """
+        Subscribe to the running generation for key, or start one with
+        produce(shared). A None key always starts a private generation.
+        """
+        shared = self._inflight.get(key) if key is not None else None
+        if shared is None or shared.cancel.is_set() or not shared.shareable:
+            shared = SharedGeneration(key)
+            if key is not None:
+                self._inflight[key] = shared
+            asyncio.ensure_future(self._run(shared, produce))
+        else:
+            metrics.inc("rag_answers_shared_total", how="coalesced")
+        shared.subscribers += 1
+        return shared
+
+    def leave(self, shared: SharedGeneration):
+        """Unsubscribe; the generation is cancelled when nobody is left to read it."""
+        shared.subscribers -= 1
+        if shared.subscribers <= 0 and not shared.done:
+            shared.cancel.set()
+
+    async def _run(self, shared: SharedGeneration, produce: Callable[[SharedGeneration], Awaitable[None]]):
+        try:
+            await produce(shared)
+            shared.finish()
+        except Exception as e:
+            shared.finish(e)
+        finally:
+            if shared.key is not None and self._inflight.get(shared.key) is shared:
+                del self._inflight[shared.key]
+
+
+metrics.describe("rag_answers_shared_total", "counter",
+                 "Questions answered from another client's generation (coalesced) or the answer cache (cached).")
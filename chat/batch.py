@@ -0,0 +1,170 @@
+"""Answer a JSONL file of questions through the same pipeline as the UI.
+
+Each input line is {"question": ..., "id": ..., "document_id": ...}. "id"
+defaults to the line number. "document_id" is optional and asks about that
+document only, as if it had been picked in the Documents dialog. Results are
+appended to the output as they finish:
+
+    {"id", "question", "document_id", "answer", "sources", "timings", "error", "elapsed"}
+
+Items already in the output without an error are skipped, so an interrupted
+run picks up where it stopped. Each worker keeps one state and client token,
+but every question gets a fresh RAGFlow chat session, so an answer never
+depends on the questions the worker answered before it.
+
+    python -m chat.batch questions.jsonl results.jsonl --workers 4 --rate 2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Set
+
+from chat.headless import new_state, run_background
+from chat.metrics import metrics
+
+
+def read_items(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", str(line_number))
+            item["id"] = str(item["id"])
+            yield item
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids of items already answered without an error; a torn last line is ignored."""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not record.get("error"):
+                done.add(str(record["id"]))
+    return done
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all workers; rate <= 0 disables it."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self._interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def answer_item(state_module, state, item: Dict[str, Any]) -> Dict[str, Any]:
+    record = {"id": item["id"], "question": item["question"], "document_id": item.get("document_id")}
+    started = time.perf_counter()
+    try:
+        with metrics.stage_timings() as timings:
+            if item.get("document_id"):
+                document = state_module.document_catalog.get(item["document_id"])
+                if document is None:
+                    raise LookupError(f"Unknown document {item['document_id']}")
+                await state.select_document(document)
+            else:
+                state.clear_selected_document()
+            await run_background(state, state_module.State.process_question, {"question": item["question"]},
+                                 on_update=lambda: None)
+        qa = state.chats[state.current_chat][-1]
+        record.update(answer=qa.answer, sources=list(qa.sources), timings=timings, error=qa.error or None)
+    except Exception as e:
+        record.update(answer="", sources=[], timings={}, error=f"{type(e).__name__}: {e}")
+    record["elapsed"] = time.perf_counter() - started
+    return record
+
+
+async def run(args, state_module) -> int:
+    done = completed_ids(args.output)
+    items = [item for item in read_items(args.input) if item["id"] not in done]
+    print(f"{len(items)} questions to answer ({len(done)} already done).", file=sys.stderr)
+
+    deadline = time.monotonic() + args.catalog_timeout
+    while state_module.document_catalog.records() is None:
+        if time.monotonic() > deadline:
+            raise RuntimeError("The document catalog did not load; is RAGFlow reachable?")
+        await asyncio.sleep(0.5)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    limiter = RateLimiter(args.rate)
+    failures: List[str] = []
+
+    with open(args.output, "a+", encoding="utf-8") as out:
+        # Start on a fresh line if the previous run was killed mid-write.
+        end = out.tell()
+        if end:
+            out.seek(end - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        async def worker(number: int):
+            state = new_state(state_module.State, f"batch-worker-{number}")
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await limiter.wait()
+                try:
+                    record = await answer_item(state_module, state, item)
+                finally:
+                    # End the conversation so the next item starts on a fresh session.
+                    await asyncio.to_thread(state_module.session_manager.release, state._client_token())
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if record["error"]:
+                    failures.append(record["id"])
+                print(f"[{record['id']}] {record['elapsed']:.1f}s {record['error'] or 'ok'}", file=sys.stderr)
+
+        await asyncio.gather(*(worker(number) for number in range(max(1, args.workers))))
+
+    print(f"Finished; {len(failures)} failed (rerun to retry them).", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL file of questions.")
+    parser.add_argument("output", help="JSONL file results are appended to.")
+    parser.add_argument("--workers", type=int, default=4, help="Questions answered concurrently.")
+    parser.add_argument("--rate", type=float, default=0.0, help="Max questions started per second (0 = unlimited).")
+    parser.add_argument("--no-answer-cache", action="store_true",
+                        help="Generate every answer, even for repeated questions.")
+    parser.add_argument("--catalog-timeout", type=float, default=120.0,
+                        help="Seconds to wait for the document catalog to load.")
+    args = parser.parse_args(argv)
+
+    # Configuration is read at import time. Keep batch answers out of the UI's chat history.
+    os.environ["CHAT_HISTORY_DB"] = os.path.join(tempfile.mkdtemp(prefix="rag-batch-"), "chat_history.db")
+    if args.no_answer_cache:
+        os.environ["ANSWER_CACHE_TTL"] = "0"
+    from chat import state as state_module
+
+    return asyncio.run(run(args, state_module))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Process-wide snapshot of the documents in the ACRES dataset.
+
+State events read the catalog from memory; the RAGFlow document listing is
+only fetched by a background thread when the snapshot is missing or stale.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from chat.document_search import DOCUMENT_PAGE_SIZE, NameIndex
+from chat.metrics import metrics
+from chat.shared_cache import SharedTier
+
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))                # Seconds before a snapshot is stale.
+CATALOG_RETRY = float(os.getenv("CATALOG_RETRY", "30"))             # Seconds to wait after a failed refresh.
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "1000"))
+
+
+def serialize_document(doc) -> Dict[str, Any]:
+    return {
+        "id": doc.id,
+        "name": doc.name,
+        "chunk_count": getattr(doc, "chunk_count", None),
+        # Older SDKs do not expose update_time; the parse start time changes on re-parse too.
+        "update_time": getattr(doc, "update_time", None) or getattr(doc, "process_begin_at", None),
+    }
+
+
+def fingerprint(documents: List[Dict[str, Any]]) -> str:
+    """Stable digest of a document list; changes when any document is added, removed or re-parsed."""
+    records = sorted((doc["id"], doc["update_time"], doc["chunk_count"]) for doc in documents)
+    return hashlib.sha1(json.dumps(records, default=str).encode("utf-8")).hexdigest()
+
+
+class DocumentCatalog:
+    """
+    In-memory, stale-while-revalidate view of every document in a dataset.
+
+    With a shared tier, replicas reuse each other's snapshot while it is
+    fresh, and a replica that sees the dataset change tells the others to
+    refresh.
+    """
+
+    def __init__(self, get_dataset: Callable[[], Any], ttl: float = CATALOG_TTL,
+                 page_size: int = CATALOG_PAGE_SIZE, shared: Optional[SharedTier] = None):
+        self._get_dataset = get_dataset
+        self._shared = shared
+        self._ttl = ttl
+        self._page_size = page_size
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._next_refresh = 0.0
+        self._documents: List[Dict[str, Any]] = []   # {"id", "name"} pairs handed to the UI.
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._search = NameIndex([])                 # Rebuilt on every refresh.
+        self.version: Optional[str] = None            # Fingerprint of ids and document versions.
+        if shared is not None:
+            shared.subscribe("catalog", lambda _: self.expire())
+
+    def _fetch_all(self) -> List[Dict[str, Any]]:
+        """Page through the dataset until a short page is returned."""
+        dataset = self._get_dataset()
+        documents = []
+        page = 1
+        while True:
+            batch = dataset.list_documents(page=page, page_size=self._page_size)
+            documents.extend(serialize_document(doc) for doc in batch)
+            if len(batch) < self._page_size:
+                return documents
+            page += 1
+
+    def _shared_snapshot(self) -> Optional[List[Dict[str, Any]]]:
+        """Another replica's document list, if it was fetched within the TTL."""
+        if self._shared is None:
+            return None
+        snapshot = self._shared.get("catalog", "documents")
+        if snapshot is None or time.time() - snapshot["fetched_at"] >= self._ttl:
+            return None
+        return snapshot["documents"]
+
+    def refresh(self):
+        """
+        Fetch the full document list and swap it in. On failure the previous
+        snapshot is kept and the next attempt is delayed by CATALOG_RETRY.
+        """
+        fetched = False
+        try:
+            documents = self._shared_snapshot()
+            if documents is None:
+                with metrics.span("catalog_fetch"):
+                    documents = self._fetch_all()
+                fetched = True
+        except Exception as e:
+            print(f"Error refreshing document catalog: {e}")
+            metrics.inc("rag_errors_total", stage="catalog_fetch")
+            with self._lock:
+                self._next_refresh = time.monotonic() + CATALOG_RETRY
+                self._refreshing = False
+            return
+        pairs = [{"id": doc["id"], "name": doc["name"]} for doc in documents]
+        search = NameIndex(pairs)
+        previous = self.version
+        with self._lock:
+            self._documents = pairs
+            self._search = search
+            self._by_id = {doc["id"]: doc for doc in documents}
+            self.version = fingerprint(documents)
+            self._next_refresh = time.monotonic() + self._ttl
+            self._refreshing = False
+        if fetched and self._shared is not None:
+            self._shared.put("catalog", "documents", {"fetched_at": time.time(), "documents": documents},
+                             ttl=max(1, int(self._ttl)))
+            if previous is not None and previous != self.version:
+                self._shared.invalidate("catalog")
+
+    def expire(self):
+        """Treat the snapshot as stale and refresh it in the background."""
+        with self._lock:
+            self._next_refresh = 0.0
+        self.start()
+
+    def start(self):
+        """Kick off a background refresh if one is due and none is running."""
+        with self._lock:
+            if self._refreshing or time.monotonic() < self._next_refresh:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="document-catalog", daemon=True).start()
+
+    def documents(self) -> List[Dict[str, Any]]:
+        self.start()
+        return list(self._documents)
+
+    def search(self, query: str, page: int = 0, page_size: int = DOCUMENT_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], int]:
+        """One page of documents whose names match the query, and the number of matches."""
+        self.start()
+        return self._search.page(query, page, page_size)
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Full catalog record (including version fields) for a document id."""
+        self.start()
+        return self._by_id.get(doc_id)
+
+    def records(self) -> Optional[List[Dict[str, Any]]]:
+        """Full records of every document, or None until the first refresh succeeds."""
+        self.start()
+        return list(self._by_id.values()) if self.version is not None else None
@@ -2,8 +2,12 @@
 
 import reflex as rx
 import reflex_chakra as rc
+from starlette.responses import JSONResponse, PlainTextResponse
 
+from chat import client, profiling
 from chat.components import chat, navbar
+from chat.metrics import metrics
+from chat.state import State
 
 
 def index() -> rx.Component:
@@ -20,6 +24,9 @@ def index() -> rx.Component:
     )
 
 
+# Opt-in (STATE_PROFILE_DIR): record what each event serializes and sends, before the app compiles.
+profiling.install(rx.State)
+
 # Add state and page to the app.
 app = rx.App(
     theme=rx.theme(
@@ -27,4 +34,31 @@ app = rx.App(
         accent_color="green",
     ),
 )
-app.add_page(index)
+app.add_page(index, on_load=State.load_history)
+
+
+async def ready():
+    """Readiness probe: 200 once the RAGFlow assistant and dataset are resolved."""
+    if client.is_ready():
+        return {"ready": True}
+    client.warm_up()
+    return JSONResponse({"ready": False, "error": client.last_error}, status_code=503)
+
+
+app.api.add_api_route("/ready", ready)
+
+
+async def prometheus_metrics():
+    """Stage latency histograms, counters and cache stats in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+app.api.add_api_route("/metrics", prometheus_metrics)
+
+
+async def state_profile():
+    """Aggregated state payload profile; empty unless STATE_PROFILE_DIR is set."""
+    return JSONResponse(profiling.profiler.report())
+
+
+app.api.add_api_route("/state-profile", state_profile)
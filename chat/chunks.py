@@ -0,0 +1,268 @@
+"""Process-wide cache of the chunks belonging to each document."""
+
+import os
+import threading
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from chat.cache import LRUCache
+from chat.metrics import metrics
+from chat.shared_cache import SharedTier
+
+CHUNK_CACHE_BYTES = int(os.getenv("CHUNK_CACHE_BYTES", str(256 * 1024 * 1024)))
+CHUNK_PAGE_SIZE = int(os.getenv("CHUNK_PAGE_SIZE", "200"))
+CHUNK_FETCH_WORKERS = int(os.getenv("CHUNK_FETCH_WORKERS", "8"))
+
+
+def serialize_chunk(chunk) -> dict:
+    return {
+        "id": chunk.id,
+        "content": chunk.content,
+        "document_id": getattr(chunk, "document_id", None),
+        "document_name": getattr(chunk, "document_name", None),
+        "position": getattr(chunk, "position", None),
+        "dataset_id": getattr(chunk, "dataset_id", None),
+        "similarity": getattr(chunk, "similarity", None),
+        "vector_similarity": getattr(chunk, "vector_similarity", None),
+        "term_similarity": getattr(chunk, "term_similarity", None),
+    }
+
+
+def serialize_retrieved(chunk: Dict[str, Any]) -> dict:
+    """serialize_chunk for a raw /retrieval chunk dict, which also carries the similarity scores."""
+    return {
+        "id": chunk.get("id"),
+        "content": chunk.get("content"),
+        "document_id": chunk.get("document_id"),
+        "document_name": chunk.get("document_name") or chunk.get("document_keyword"),
+        "position": None,
+        "dataset_id": chunk.get("dataset_id") or chunk.get("kb_id"),
+        "similarity": chunk.get("similarity"),
+        "vector_similarity": chunk.get("vector_similarity"),
+        "term_similarity": chunk.get("term_similarity"),
+    }
+
+
+def serialize_chunks(chunks) -> List[Dict[str, Any]]:
+    return [
+        serialize_chunk(chunk)
+        for chunk in chunks
+        if chunk is not None and getattr(chunk, "content", None) is not None
+    ]
+
+
+class ChunkTable:
+    """
+    Read-only, column-oriented chunks of one document. Contents and ids are
+    each kept as one string sliced by offset arrays, and the per-document
+    fields are stored once. Rows are built as serialize_chunk-style dicts
+    only when indexed or iterated.
+    """
+
+    __slots__ = ("document_id", "document_name", "dataset_id", "_text", "_text_offsets", "_ids", "_id_offsets")
+
+    def __init__(self, document_id: str, document_name: Optional[str], dataset_id: Optional[str],
+                 ids: List[str], contents: List[str]):
+        self.document_id = document_id
+        self.document_name = document_name
+        self.dataset_id = dataset_id
+        self._text = "".join(contents)
+        self._text_offsets = _offsets(contents)
+        self._ids = "".join(ids)
+        self._id_offsets = _offsets(ids)
+
+    @classmethod
+    def from_chunks(cls, document_id: str, chunks: List[Dict[str, Any]]) -> "ChunkTable":
+        first = chunks[0] if chunks else {}
+        return cls(
+            document_id,
+            first.get("document_name"),
+            first.get("dataset_id"),
+            [chunk["id"] or "" for chunk in chunks],
+            [chunk["content"] for chunk in chunks],
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ChunkTable":
+        return cls(data["document_id"], data["document_name"], data["dataset_id"], data["ids"], data["contents"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "document_id": self.document_id,
+            "document_name": self.document_name,
+            "dataset_id": self.dataset_id,
+            "ids": [self.chunk_id(i) for i in range(len(self))],
+            "contents": [self.content(i) for i in range(len(self))],
+        }
+
+    def __len__(self) -> int:
+        return len(self._text_offsets) - 1
+
+    def content(self, i: int) -> str:
+        return self._text[self._text_offsets[i]:self._text_offsets[i + 1]]
+
+    def chunk_id(self, i: int) -> str:
+        return self._ids[self._id_offsets[i]:self._id_offsets[i + 1]]
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return {
+            "id": self.chunk_id(i),
+            "content": self.content(i),
+            "document_id": self.document_id,
+            "document_name": self.document_name,
+            "position": None,
+            "dataset_id": self.dataset_id,
+            "similarity": None,
+            "vector_similarity": None,
+            "term_similarity": None,
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self[i] for i in range(len(self)))
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the table."""
+        return (
+            len(self._text.encode("utf-8")) + len(self._ids)
+            + self._text_offsets.itemsize * len(self._text_offsets)
+            + self._id_offsets.itemsize * len(self._id_offsets)
+        )
+
+
+def _offsets(parts: List[str]) -> array:
+    offsets = array("Q", [0])
+    total = 0
+    for part in parts:
+        total += len(part)
+        offsets.append(total)
+    return offsets
+
+
+def document_version(document: Dict[str, Any]) -> tuple:
+    """Cache validator for a catalog record: changes when the document is re-parsed."""
+    return document.get("update_time"), document.get("chunk_count")
+
+
+class ChunkCache:
+    """
+    Byte-bounded LRU of each document's chunks, as a ChunkTable keyed by document id.
+
+    A miss pages through every chunk of the document concurrently, and
+    simultaneous misses for the same document share a single fetch. With a
+    shared tier, a miss first looks for another replica's copy.
+    """
+
+    def __init__(self, open_document: Callable[[str], Any], max_bytes: int = CHUNK_CACHE_BYTES,
+                 page_size: int = CHUNK_PAGE_SIZE, workers: int = CHUNK_FETCH_WORKERS,
+                 shared: Optional[SharedTier] = None):
+        self._open_document = open_document
+        self._shared = shared
+        self._page_size = page_size
+        self._workers = workers
+        self._entries = LRUCache(max_bytes=max_bytes)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk-fetch")
+        self.hits = 0
+        self.misses = 0
+        if shared is not None:
+            shared.subscribe("chunks", self._drop)
+
+    def _drop(self, doc_id: Optional[str]):
+        if doc_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(doc_id)
+
+    def stats(self) -> Dict[str, int]:
+        stats = self._entries.stats()
+        # An entry for an outdated version counts as a miss here, unlike in the LRU's own counters.
+        stats["hits"] = self.hits
+        stats["misses"] = self.misses
+        return stats
+
+    def get(self, document: Dict[str, Any]) -> ChunkTable:
+        """
+        Return the chunks of a catalog document record. Blocking; call it
+        from a worker thread.
+        """
+        doc_id = document["id"]
+        version = document_version(document)
+        entry = self._entries.get(doc_id)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+
+        with self._lock:
+            future = self._inflight.get(doc_id)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[doc_id] = future
+        if not owner:
+            return future.result()
+
+        try:
+            chunks = None
+            if self._shared is not None:
+                shared_entry = self._shared.get("chunks", doc_id)
+                if shared_entry is not None and tuple(shared_entry["version"]) == tuple(version):
+                    chunks = ChunkTable.from_dict(shared_entry["chunks"])
+            if chunks is None:
+                with metrics.span("chunk_fetch"):
+                    chunks = ChunkTable.from_chunks(doc_id, self._fetch(doc_id, document.get("chunk_count")))
+                if self._shared is not None:
+                    # A re-parsed document: other replicas drop their outdated copy.
+                    if entry is not None:
+                        self._shared.invalidate("chunks", doc_id)
+                    self._shared.put("chunks", doc_id, {"version": list(version), "chunks": chunks.to_dict()})
+            self._entries.set(doc_id, (version, chunks), size=chunks.nbytes())
+            future.set_result(chunks)
+            return chunks
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(doc_id, None)
+
+    def fetch(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Fetch a document's chunks straight from RAGFlow, one page at a time,
+        without touching the cache or the shared tier. For bulk readers such
+        as the local index sync, which would otherwise evict the papers users
+        have selected.
+        """
+        return self._fetch(document["id"], document.get("chunk_count"), concurrent=False)
+
+    def _fetch(self, doc_id: str, chunk_count: Optional[int], concurrent: bool = True) -> List[Dict[str, Any]]:
+        """
+        Fetch pages in concurrent waves until a short page is seen. When the
+        chunk count is known the first wave covers the whole document.
+        """
+        document_obj = self._open_document(doc_id)
+        page_map = self._pool.map if concurrent else map
+
+        def fetch_page(page: int):
+            return document_obj.list_chunks(page=page, page_size=self._page_size)
+
+        if chunk_count:
+            wave = max(1, -(-chunk_count // self._page_size))
+        else:
+            wave = self._workers
+        chunks = []
+        page = 1
+        while True:
+            pages = list(page_map(fetch_page, range(page, page + wave)))
+            for batch in pages:
+                chunks.extend(serialize_chunks(batch))
+            if any(len(batch) < self._page_size for batch in pages):
+                return chunks
+            page += wave
+            wave = self._workers
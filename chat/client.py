@@ -0,0 +1,281 @@
+"""Lazily initialised RAGFlow client, assistant and dataset shared by the backend.
+
+Nothing here talks to RAGFlow at import time. The first caller of
+get_assistant() / get_dataset() resolves them with bounded retries; every SDK
+call goes through one keep-alive connection pool.
+"""
+
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import requests
+from dotenv import load_dotenv
+from ragflow_sdk import RAGFlow
+from requests.adapters import HTTPAdapter
+
+T = TypeVar("T")
+
+load_dotenv()
+
+# Retrieve configuration from environment variables for RAGFlow.
+RAGFLOW_API_KEY = os.getenv("RAGFLOW_API_KEY")
+RAGFLOW_BASE_URL = os.getenv("RAGFLOW_BASE_URL")
+AGENT_NAME = os.getenv("AGENT_NAME") or os.getenv("RAGFLOW_AGENT_NAME")
+ACRES_DATABASE = os.getenv("ACRES_DATABASE")  # New env var for the database name
+# Further datasets searched together with ACRES_DATABASE, e.g. "Technical Notes,Annual Reports".
+EXTRA_DATASETS = [name.strip() for name in os.getenv("EXTRA_DATASETS", "").split(",") if name.strip()]
+
+RAGFLOW_RETRIES = int(os.getenv("RAGFLOW_RETRIES", "5"))            # Attempts per bootstrap step.
+RAGFLOW_BACKOFF = float(os.getenv("RAGFLOW_BACKOFF", "0.5"))        # First retry delay; doubles per attempt.
+RAGFLOW_POOL_SIZE = int(os.getenv("RAGFLOW_POOL_SIZE", "64"))       # Keep-alive connections per host.
+EXTRA_DATASET_MAX_BACKOFF = float(os.getenv("EXTRA_DATASET_MAX_BACKOFF", "300"))   # Seconds between lookups, at most.
+
+if not RAGFLOW_API_KEY:
+    raise Exception("Please set RAGFLOW_API_KEY environment variable.")
+if not ACRES_DATABASE:
+    raise Exception("Please set ACRES_DATABASE environment variable.")
+
+
+class PooledRAGFlow(RAGFlow):
+    """RAGFlow client whose requests share one keep-alive connection pool."""
+
+    def __init__(self, api_key: str, base_url: str, pool_size: int = RAGFLOW_POOL_SIZE):
+        super().__init__(api_key=api_key, base_url=base_url)
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.http.headers.update(self.authorization_header)
+        # The latest streaming response opened by each thread, so another thread can abort it.
+        self._streams: Dict[int, requests.Response] = {}
+        self._streams_lock = threading.Lock()
+
+    def post(self, path, json=None, stream=False, files=None):
+        response = self.http.post(url=self.api_url + path, json=json, stream=stream, files=files)
+        if stream:
+            self._track_stream(threading.get_ident(), response)
+        return response
+
+    def _track_stream(self, thread_id: int, response: requests.Response):
+        """
+        Register a streaming response for close_stream until it is exhausted
+        or closed, so an abort never hits a stream that has already finished.
+        """
+        with self._streams_lock:
+            self._streams[thread_id] = response
+        iter_content, close = response.iter_content, response.close
+
+        def forget():
+            with self._streams_lock:
+                if self._streams.get(thread_id) is response:
+                    del self._streams[thread_id]
+
+        def tracked_iter_content(*args, **kwargs):
+            # iter_lines reads through this; the generator is finalized when
+            # the stream ends or the SDK's generator is closed.
+            try:
+                yield from iter_content(*args, **kwargs)
+            finally:
+                forget()
+
+        def tracked_close():
+            forget()
+            close()
+
+        response.iter_content = tracked_iter_content
+        response.close = tracked_close
+
+    def close_stream(self, thread_id: int):
+        """
+        Abort the streaming response a thread is reading. Shutting down the
+        socket wakes a read blocked on it, and RAGFlow sees the client go away.
+        """
+        with self._streams_lock:
+            response = self._streams.pop(thread_id, None)
+        if response is None:
+            return
+        connection = getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        response.close()
+
+    def retrieve_scored(self, dataset_ids, document_ids=None, question="", page=1, page_size=30,
+                        similarity_threshold=0.2, vector_similarity_weight=0.3, top_k=1024, rerank_id=None,
+                        keyword=False) -> List[Dict[str, Any]]:
+        """
+        RAGFlow.retrieve, returning the raw chunk dicts. The SDK's Chunk drops
+        the similarity scores that ranking across datasets needs.
+        """
+        res = self.post("/retrieval", json={
+            "page": page,
+            "page_size": page_size,
+            "similarity_threshold": similarity_threshold,
+            "vector_similarity_weight": vector_similarity_weight,
+            "top_k": top_k,
+            "rerank_id": rerank_id,
+            "keyword": keyword,
+            "question": question,
+            "dataset_ids": dataset_ids,
+            "documents": document_ids or [],
+        }).json()
+        if res.get("code") == 0:
+            return res["data"].get("chunks") or []
+        raise Exception(res.get("message"))
+
+    def get(self, path, params=None, json=None):
+        return self.http.get(url=self.api_url + path, params=params, json=json)
+
+    def delete(self, path, json):
+        return self.http.delete(url=self.api_url + path, json=json)
+
+    def put(self, path, json):
+        return self.http.put(url=self.api_url + path, json=json)
+
+
+_lock = threading.Lock()
+_assistant_lock = threading.Lock()
+_dataset_lock = threading.Lock()
+_rag: Optional[PooledRAGFlow] = None
+_assistant: Any = None
+_dataset: Any = None
+_extra_datasets: Dict[str, Any] = {}
+_extra_retry: Dict[str, Tuple[float, float]] = {}   # Unresolved name -> (next lookup, backoff).
+_extra_resolving = threading.Event()
+last_error: Optional[str] = None
+
+
+def with_retry(description: str, fn: Callable[[], T], attempts: int = RAGFLOW_RETRIES) -> T:
+    """Call fn, retrying with exponential backoff; re-raises the last error."""
+    global last_error
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            last_error = f"{description}: {e}"
+            if attempt == attempts - 1:
+                raise
+            time.sleep(RAGFLOW_BACKOFF * 2 ** attempt)
+
+
+def get_rag() -> PooledRAGFlow:
+    global _rag
+    if _rag is None:
+        with _lock:
+            if _rag is None:
+                _rag = PooledRAGFlow(api_key=RAGFLOW_API_KEY, base_url=RAGFLOW_BASE_URL)
+    return _rag
+
+
+def _find_assistant():
+    assistant_list = get_rag().list_chats(name=AGENT_NAME)
+    if not assistant_list:
+        raise Exception(f"No chat agent found with name '{AGENT_NAME}'")
+    return assistant_list[0]
+
+
+def _find_dataset():
+    # Create (or get) the ACRES dataset.
+    rag_object = get_rag()
+    try:
+        return rag_object.create_dataset(name=ACRES_DATABASE)
+    except Exception as e:
+        if "Duplicated dataset name" not in str(e):
+            raise
+    datasets = rag_object.list_datasets(name=ACRES_DATABASE)
+    dataset = next((ds for ds in datasets if ds.name == ACRES_DATABASE), None)
+    if dataset is None:
+        raise Exception(f"Dataset '{ACRES_DATABASE}' exists but could not be retrieved.")
+    return dataset
+
+
+def get_assistant(attempts: int = RAGFLOW_RETRIES):
+    """The chat assistant named AGENT_NAME, resolved on first use."""
+    global _assistant
+    if _assistant is None:
+        with _assistant_lock:
+            if _assistant is None:
+                _assistant = with_retry("list_chats", _find_assistant, attempts)
+    return _assistant
+
+
+def get_dataset(attempts: int = RAGFLOW_RETRIES):
+    """The ACRES_DATABASE dataset, resolved on first use."""
+    global _dataset
+    if _dataset is None:
+        with _dataset_lock:
+            if _dataset is None:
+                _dataset = with_retry("resolve dataset", _find_dataset, attempts)
+    return _dataset
+
+
+def _find_extra_dataset(name: str):
+    dataset = next((ds for ds in get_rag().list_datasets(name=name) if ds.name == name), None)
+    if dataset is None:
+        raise Exception(f"Dataset '{name}' not found")
+    return dataset
+
+
+def _resolve_extra_datasets():
+    """Look up the unresolved EXTRA_DATASETS whose backoff has passed."""
+    try:
+        for name in EXTRA_DATASETS:
+            next_lookup, backoff = _extra_retry.get(name, (0.0, RAGFLOW_BACKOFF))
+            if name in _extra_datasets or time.monotonic() < next_lookup:
+                continue
+            try:
+                _extra_datasets[name] = _find_extra_dataset(name)
+                _extra_retry.pop(name, None)
+            except Exception as e:
+                print(f"Skipping dataset '{name}' for {backoff:g}s: {e}")
+                _extra_retry[name] = (time.monotonic() + backoff, min(backoff * 2, EXTRA_DATASET_MAX_BACKOFF))
+    finally:
+        _extra_resolving.clear()
+
+
+def get_retrieval_datasets() -> List[Any]:
+    """
+    ACRES_DATABASE followed by the EXTRA_DATASETS resolved so far. The others
+    are looked up on a background thread, with exponential backoff for names
+    that can't be found, so they never hold up retrieval from the rest.
+    """
+    datasets = [get_dataset()]
+    datasets.extend(_extra_datasets[name] for name in EXTRA_DATASETS if name in _extra_datasets)
+    if len(datasets) <= len(EXTRA_DATASETS) and not _extra_resolving.is_set():
+        now = time.monotonic()
+        if any(_extra_retry.get(name, (0.0, 0.0))[0] <= now for name in EXTRA_DATASETS if name not in _extra_datasets):
+            _extra_resolving.set()
+            threading.Thread(target=_resolve_extra_datasets, name="ragflow-extra-datasets", daemon=True).start()
+    return datasets
+
+
+def is_ready() -> bool:
+    """Whether the assistant and dataset have been resolved; never blocks."""
+    return _assistant is not None and _dataset is not None
+
+
+_warming = threading.Event()
+
+
+def warm_up():
+    """Resolve the assistant and datasets on a background thread, unless already doing so."""
+    if is_ready() or _warming.is_set():
+        return
+    _warming.set()
+
+    def run():
+        try:
+            get_assistant()
+            get_retrieval_datasets()
+        except Exception as e:
+            print(f"RAGFlow is not reachable yet: {e}")
+        finally:
+            _warming.clear()
+
+    threading.Thread(target=run, name="ragflow-warm-up", daemon=True).start()
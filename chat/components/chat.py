@@ -82,10 +82,68 @@ def message(qa: QA) -> rx.Component:
     )
 
 
+def pending_message() -> rx.Component:
+    """The question being answered and its answer streamed so far."""
+    return rx.box(
+        rx.box(
+            rx.markdown(
+                State.pending_question,
+                background_color=rx.color("mauve", 4),
+                color=rx.color("mauve", 12),
+                **message_style,
+            ),
+            text_align="right",
+            margin_top="1em",
+        ),
+        rx.cond(
+            State.queue_position > 0,
+            rx.text(
+                "Waiting for the assistant: position ",
+                State.queue_position,
+                " in the queue.",
+                color=rx.color("mauve", 10),
+                size="2",
+                padding_top="1em",
+            ),
+        ),
+        rx.box(
+            rx.cond(
+                State.streaming_answer == "",
+                loading_icon(height="2em"),
+                rx.markdown(
+                    State.streaming_answer,
+                    background_color=rx.color("mauve", 1),
+                    color=rx.color("accent", 12),
+                    **message_style,
+                ),
+            ),
+            text_align="left",
+            padding_top="1em",
+        ),
+        width="100%",
+    )
+
+
 def chat() -> rx.Component:
     """List all the messages in a single conversation."""
     return rx.vstack(
-        rx.box(rx.foreach(State.chats[State.current_chat], message), width="100%"),
+        rx.box(
+            rx.cond(
+                State.older_available[State.current_chat],
+                rx.center(
+                    rx.button(
+                        "Load earlier messages",
+                        on_click=State.load_older_messages,
+                        variant="ghost",
+                        size="1",
+                    ),
+                ),
+            ),
+            rx.foreach(State.chats[State.current_chat], message),
+            # Only in the chat the question was asked in, if the user has switched since.
+            rx.cond(State.processing & (State.pending_chat == State.current_chat), pending_message()),
+            width="100%",
+        ),
         py="8",
         flex="1",
         width="100%",
@@ -110,27 +168,38 @@ def action_bar() -> rx.Component:
                             ),
                             placeholder="Ask anything...",
                             id="question",
+                            # Partial text starts a speculative retrieval (see chat.prefetch).
+                            on_change=State.prefetch_question.debounce(300),
                             width=["15em", "20em", "45em", "50em", "50em", "50em"],
                             height=["1em", "1em", "2em", "4em", "4em", "4em"],
                             border_radius="15px",
                             font_size="1em",
                         ),
-                        rx.button(
-                            rx.cond(
-                                State.processing,
-                                loading_icon(height="2em"),
+                        rx.cond(
+                            State.processing,
+                            # Stops the answer being streamed; submitting again replaces it.
+                            rx.button(
+                                rx.icon("square", height="1.5em", width="1.5em"),
+                                type="button",
+                                on_click=State.stop_generation,
+                                height="4em",
+                                width="4em",
+                                border_radius="50px",
+                                padding="0",
+                                margin="0",
+                            ),
+                            rx.button(
                                 rx.icon("arrow-up", height="2.25em", width="2.25em"),
+                                type="submit",
+                                height="4em",
+                                width="4em",
+                                border_radius="50px",
+                                padding="0",
+                                margin="0",
                             ),
-                            type="submit",
-                            height="4em",
-                            width="4em",
-                            border_radius="50px",
-                            padding="0",
-                            margin="0",
                         ),
                         align_items="center",
                     ),
-                    is_disabled=State.processing,
                 ),
                 on_submit=State.process_question,
                 reset_on_submit=True,
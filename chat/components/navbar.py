@@ -43,14 +43,14 @@ def navbar():
                         )
                     )
                 ),
-                # Documents Modal using rx.dialog.
+                # Documents Modal using rx.dialog; only one page of search results is rendered.
                 rx.dialog.root(
                     rx.dialog.trigger(
                         rx.button("Documents")
                     ),
                     rx.dialog.content(
                         rx.cond(
-                            # When no document is selected, show "All Documents" button + list of documents.
+                            # When no document is selected, show "All Documents" button + a searchable page of documents.
                             State.selected_document == None,
                             rx.box(
                                 rx.button(
@@ -60,8 +60,18 @@ def navbar():
                                     margin_bottom="0.5em",
                                     variant="outline"
                                 ),
+                                rx.debounce_input(
+                                    rx.input(
+                                        placeholder="Search documents...",
+                                        value=State.document_query,
+                                        on_change=State.search_documents,
+                                        width="100%",
+                                        margin_bottom="0.5em",
+                                    ),
+                                    debounce_timeout=250,
+                                ),
                                 rx.foreach(
-                                    State.documents,
+                                    State.document_results,
                                     lambda doc: rx.button(
                                         doc["name"],
                                         on_click=lambda doc=doc: State.select_document(doc),
@@ -69,7 +79,25 @@ def navbar():
                                         margin_bottom="0.5em",
                                         variant="outline"
                                     )
-                                )
+                                ),
+                                rx.hstack(
+                                    rx.button(
+                                        rx.icon("chevron-left"),
+                                        on_click=State.previous_document_page,
+                                        disabled=State.document_page == 0,
+                                        variant="soft",
+                                    ),
+                                    rx.text(State.document_page_label, size="2"),
+                                    rx.button(
+                                        rx.icon("chevron-right"),
+                                        on_click=State.next_document_page,
+                                        disabled=~State.document_has_next,
+                                        variant="soft",
+                                    ),
+                                    justify_content="space-between",
+                                    align_items="center",
+                                    width="100%",
+                                ),
                             ),
                             # When a document is selected, show its name and an "All Documents" button.
                             rx.box(
@@ -85,7 +113,8 @@ def navbar():
                         overflow_y="auto",       # Enable scrolling if needed.
                         padding="1em",
                         background_color=rx.color("mauve", 2)
-                    )
+                    ),
+                    on_open_change=State.open_documents,
                 ),
             ),
             justify_content="space-between",
@@ -0,0 +1,117 @@
+"""Packing of retrieved chunks into the knowledge1 prompt context."""
+
+import logging
+import os
+import re
+import zlib
+from typing import Any, Dict, List, Sequence, Tuple
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))       # 1.0 = relevance only.
+CONTEXT_DUP_THRESHOLD = float(os.getenv("CONTEXT_DUP_THRESHOLD", "0.8"))  # Shingle overlap treated as a duplicate.
+# Fields the assistant prompt actually uses.
+CONTEXT_FIELDS = tuple(os.getenv("CONTEXT_FIELDS", "document_name,content").split(","))
+
+SHINGLE_SIZE = 3
+# Wide enough that two unrelated 500-word chunks share well under 1% of their bits.
+SIGNATURE_BITS = 32768
+
+_WORD = re.compile(r"\w+")
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) without a tokenizer dependency."""
+    return (len(text) + 3) // 4
+
+
+def shingle_signature(text: str) -> int:
+    """
+    Word 3-gram shingles hashed into a SIGNATURE_BITS-wide bitset, packed in
+    an int so overlaps are a single AND plus popcount.
+    """
+    words = _WORD.findall(text.lower())
+    signature = 0
+    for i in range(max(1, len(words) - SHINGLE_SIZE + 1)):
+        shingle = " ".join(words[i:i + SHINGLE_SIZE]).encode("utf-8")
+        signature |= 1 << (zlib.crc32(shingle) % SIGNATURE_BITS)
+    return signature
+
+
+def overlap(a: int, b: int) -> float:
+    """Jaccard similarity of two shingle signatures."""
+    union = (a | b).bit_count()
+    return (a & b).bit_count() / union if union else 0.0
+
+
+def relevance_scores(chunks: Sequence[Dict[str, Any]]) -> List[float]:
+    """
+    Retrieval similarity scaled to [0, 1]. When any chunk has no similarity
+    (the SDK's Chunk drops it) or all are equal, relevance follows the
+    retrieval order instead: 1 - rank / n.
+    """
+    n = len(chunks)
+    scores = [chunk.get("similarity") for chunk in chunks]
+    if n and None not in scores:
+        low, high = min(scores), max(scores)
+        if high > low:
+            return [(score - low) / (high - low) for score in scores]
+    return [1 - i / n for i in range(n)]
+
+
+def context_fields(chunks: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{field: chunk.get(field) for field in CONTEXT_FIELDS} for chunk in chunks]
+
+
+def pack_context(chunks: Sequence[Dict[str, Any]], budget: int = CONTEXT_TOKEN_BUDGET,
+                 mmr_lambda: float = CONTEXT_MMR_LAMBDA) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Choose chunks by maximal marginal relevance until the token budget is spent.
+
+    Relevance comes from relevance_scores(); redundancy is the highest
+    shingle overlap with any chunk already chosen. Ties go to the earlier chunk. Near-duplicates
+    (overlap >= CONTEXT_DUP_THRESHOLD) are never chosen.
+
+    Returns:
+        The chosen chunks in selection order, and stats on chunks and tokens
+        in/out, near-duplicates and chunks over the budget. The stats are also
+        logged at debug level.
+    """
+    n = len(chunks)
+    tokens = [estimate_tokens(chunk.get("content") or "") for chunk in chunks]
+    relevance = relevance_scores(chunks)
+    signatures = [shingle_signature(chunk.get("content") or "") for chunk in chunks]
+
+    redundancy = [0.0] * n   # Max overlap with the chosen set, updated after each pick.
+    remaining = set(range(n))
+    chosen: List[int] = []
+    used = 0
+    duplicates = over_budget = 0
+    while remaining:
+        best = max(remaining, key=lambda i: (mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy[i], -i))
+        remaining.discard(best)
+        if redundancy[best] >= CONTEXT_DUP_THRESHOLD:
+            duplicates += 1
+            continue
+        if used + tokens[best] > budget:
+            over_budget += 1
+            continue
+        chosen.append(best)
+        used += tokens[best]
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], overlap(signatures[best], signatures[i]))
+
+    tokens_in = sum(tokens)
+    stats = {
+        "chunks_in": n,
+        "chunks_out": len(chosen),
+        "tokens_in": tokens_in,
+        "tokens_out": used,
+        "tokens_saved": tokens_in - used,
+        "duplicates": duplicates,
+        "over_budget": over_budget,
+    }
+    logger.debug("Packed context: %d of %d chunks (%d near-duplicates, %d over budget), %d of %d tokens budgeted",
+                 len(chosen), n, duplicates, over_budget, used, budget)
+    return [chunks[i] for i in chosen], stats
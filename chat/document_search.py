@@ -0,0 +1,71 @@
+"""Prefix search over document names for the Documents picker."""
+
+import bisect
+import os
+import re
+import unicodedata
+from typing import Any, Dict, List, Tuple
+
+from chat.cache import LRUCache
+
+DOCUMENT_PAGE_SIZE = int(os.getenv("DOCUMENT_PAGE_SIZE", "50"))
+DOCUMENT_SEARCH_CACHE = int(os.getenv("DOCUMENT_SEARCH_CACHE", "256"))    # Queries whose matches are kept.
+
+_TOKEN = re.compile(r"\w+")
+
+
+def name_tokens(text: str) -> List[str]:
+    return _TOKEN.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+class NameIndex:
+    """
+    Sorted (token, document) pairs over every document name. A query matches
+    documents where each query word is a prefix of some word of the name;
+    results are ordered by name.
+    """
+
+    def __init__(self, documents: List[Dict[str, Any]]):
+        self._documents = sorted(documents, key=lambda doc: (doc["name"].casefold(), doc["id"]))
+        pairs = sorted(
+            (token, ordinal)
+            for ordinal, doc in enumerate(self._documents)
+            for token in set(name_tokens(doc["name"]))
+        )
+        self._tokens = [token for token, _ in pairs]
+        self._ordinals = [ordinal for _, ordinal in pairs]
+        self._matches = LRUCache(max_entries=DOCUMENT_SEARCH_CACHE)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _prefix_range(self, prefix: str) -> Tuple[int, int]:
+        return bisect.bisect_left(self._tokens, prefix), bisect.bisect_left(self._tokens, prefix + "\U0010ffff")
+
+    def matches(self, query: str) -> List[int]:
+        """Ordinals (in name order) of the documents matching every word of the query."""
+        words = sorted(set(name_tokens(query)))
+        if not words:
+            return list(range(len(self._documents)))
+        key = tuple(words)
+        cached = self._matches.get(key)
+        if cached is not None:
+            return cached
+        # Intersect from the most selective word down.
+        ranges = sorted((self._prefix_range(word) for word in words), key=lambda span: span[1] - span[0])
+        matched = set(self._ordinals[ranges[0][0]:ranges[0][1]])
+        for lo, hi in ranges[1:]:
+            if not matched:
+                break
+            matched.intersection_update(self._ordinals[lo:hi])
+        ordinals = sorted(matched)
+        self._matches.set(key, ordinals)
+        return ordinals
+
+    def page(self, query: str, page: int = 0, page_size: int = DOCUMENT_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], int]:
+        """One page of matching {"id", "name"} records and the total number of matches."""
+        start = max(0, page) * page_size
+        if not name_tokens(query):
+            return self._documents[start:start + page_size], len(self._documents)
+        ordinals = self.matches(query)
+        return [self._documents[ordinal] for ordinal in ordinals[start:start + page_size]], len(ordinals)
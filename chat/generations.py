@@ -0,0 +1,96 @@
+"""Tracks the answer being generated for each client so it can be cancelled.
+
+An answer is cancelled when the user presses stop, when the same client asks
+a new question, or when the client's websocket has been gone for longer than
+GENERATION_DISCONNECT_GRACE seconds. That grace period lets a page reload
+reconnect without losing the answer.
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+from chat.metrics import metrics
+
+GENERATION_REAP_INTERVAL = float(os.getenv("GENERATION_REAP_INTERVAL", "2.0"))
+GENERATION_DISCONNECT_GRACE = float(os.getenv("GENERATION_DISCONNECT_GRACE", "5.0"))
+
+
+def client_connected(token: str) -> Optional[bool]:
+    """Whether a websocket for this client token is open here; None if Reflex can't tell us."""
+    try:
+        from reflex.utils.prerequisites import get_app
+        namespace = get_app().app.event_namespace
+        return token in namespace.token_to_sid
+    except Exception:
+        return None
+
+
+class Generation:
+    def __init__(self, token: str):
+        self.token = token
+        self.cancelled = asyncio.Event()
+        self.reason = ""
+        self.done = asyncio.Event()
+        self.missing_since: Optional[float] = None
+
+    def cancel(self, reason: str):
+        if not self.cancelled.is_set():
+            self.reason = reason
+            self.cancelled.set()
+            metrics.inc("rag_cancelled_total", reason=reason)
+
+
+class GenerationRegistry:
+    """At most one generation per client token. Use it from the backend's event loop."""
+
+    def __init__(self, reap_interval: float = GENERATION_REAP_INTERVAL, grace: float = GENERATION_DISCONNECT_GRACE):
+        self._reap_interval = reap_interval
+        self._grace = grace
+        self._active: Dict[str, Generation] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._active)
+
+    async def begin(self, token: str) -> Generation:
+        """Register a new generation, cancelling and waiting out the client's previous one."""
+        while (previous := self._active.get(token)) is not None:
+            previous.cancel("superseded")
+            await previous.done.wait()
+        generation = self._active[token] = Generation(token)
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_forever())
+        return generation
+
+    def finish(self, generation: Generation):
+        generation.done.set()
+        if self._active.get(generation.token) is generation:
+            del self._active[generation.token]
+
+    def cancel(self, token: str, reason: str) -> bool:
+        generation = self._active.get(token)
+        if generation is None:
+            return False
+        generation.cancel(reason)
+        return True
+
+    def reap(self):
+        """Cancel generations whose client has been disconnected for longer than the grace period."""
+        now = time.monotonic()
+        for generation in list(self._active.values()):
+            if client_connected(generation.token) is not False:
+                generation.missing_since = None
+            elif generation.missing_since is None:
+                generation.missing_since = now
+            elif now - generation.missing_since >= self._grace:
+                generation.cancel("disconnected")
+
+    async def _reap_forever(self):
+        while self._active:
+            await asyncio.sleep(self._reap_interval)
+            self.reap()
+
+
+metrics.describe("rag_cancelled_total", "counter", "Answers cancelled before completion, by reason.")
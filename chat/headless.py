@@ -0,0 +1,69 @@
+"""Running State event handlers outside the Reflex runtime.
+
+Used by the load benchmark and the batch runner to drive the exact pipeline
+the UI uses, without a browser or websocket.
+"""
+
+import functools
+import inspect
+import types
+from typing import Callable
+
+import reflex as rx
+from reflex.constants import RouteVar
+
+try:
+    from reflex.istate.data import RouterData
+except ImportError:  # Reflex < 0.5
+    from reflex.state import RouterData
+
+
+def new_state(state_cls, token: str):
+    """
+    A State instance outside the Reflex runtime, with its own client token.
+    It is built under a root rx.State whose router is set up from router data
+    the way Reflex does for each event, so the token reaches the substate.
+    """
+    root = rx.State(_reflex_internal_init=True)
+    router_data = {RouteVar.CLIENT_TOKEN: token, RouteVar.SESSION_ID: token, RouteVar.PATH: "/", RouteVar.QUERY: {}}
+    root.router_data = router_data
+    # RouterData is built by from_router_data() in newer Reflex versions and by its constructor in older ones.
+    from_router_data = getattr(RouterData, "from_router_data", RouterData)
+    root.router = from_router_data(router_data)
+    return root.get_substate(state_cls.get_full_name().split("."))
+
+
+class BackgroundProxy:
+    """
+    Stands in for Reflex's StateProxy when running a background event outside
+    the Reflex runtime: reads and writes go to the state, and leaving an
+    `async with` block is where Reflex would push a delta, so on_update runs.
+    """
+
+    def __init__(self, state, on_update: Callable[[], None]):
+        object.__setattr__(self, "_state", state)
+        object.__setattr__(self, "_on_update", on_update)
+
+    def __getattr__(self, name):
+        state_cls = type(self._state)
+        handler = state_cls.event_handlers.get(name)
+        if handler is not None:
+            return functools.partial(handler.fn, self)
+        attr = inspect.getattr_static(state_cls, name, None)
+        if inspect.isfunction(attr):
+            return types.MethodType(attr, self)
+        return getattr(self._state, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._state, name, value)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._on_update()
+
+
+async def run_background(state, handler, *args, on_update: Callable[[], None]):
+    """Run a background event handler such as State.process_question against a plain state."""
+    await handler.fn(BackgroundProxy(state, on_update), *args)
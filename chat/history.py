@@ -0,0 +1,96 @@
+"""SQLite-backed chat history, so Reflex state only holds a window of recent messages."""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+CHAT_HISTORY_DB = os.getenv("CHAT_HISTORY_DB", "chat_history.db")
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "20"))       # Messages kept in state per chat.
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))  # Messages fetched per "load earlier".
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    token TEXT NOT NULL,
+    chat TEXT NOT NULL,
+    created REAL NOT NULL DEFAULT (julianday('now')),
+    PRIMARY KEY (token, chat)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    token TEXT NOT NULL,
+    chat TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    PRIMARY KEY (token, chat, seq)
+);
+"""
+
+
+class ChatHistory:
+    """
+    Append-only store of QAs keyed by client token and chat name.
+
+    Messages carry a per-chat sequence number; pages are read backwards from
+    a sequence cursor. One connection is opened per thread.
+    """
+
+    def __init__(self, path: str = CHAT_HISTORY_DB):
+        self._path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def chat_names(self, token: str) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT chat FROM chats WHERE token = ? ORDER BY created", (token,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def create_chat(self, token: str, chat: str):
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO chats (token, chat) VALUES (?, ?)", (token, chat))
+
+    def delete_chat(self, token: str, chat: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chats WHERE token = ? AND chat = ?", (token, chat))
+            conn.execute("DELETE FROM messages WHERE token = ? AND chat = ?", (token, chat))
+
+    def append(self, token: str, chat: str, question: str, answer: str, sources: List[str]) -> int:
+        """Store a QA and return its sequence number."""
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO chats (token, chat) VALUES (?, ?)", (token, chat))
+            # Allocate the sequence number in the INSERT itself so concurrent appends cannot collide.
+            cursor = conn.execute(
+                "INSERT INTO messages (token, chat, seq, question, answer, sources)"
+                " SELECT ?, ?, COALESCE(MAX(seq), -1) + 1, ?, ?, ? FROM messages WHERE token = ? AND chat = ?",
+                (token, chat, question, answer, json.dumps(sources), token, chat),
+            )
+            row = conn.execute("SELECT seq FROM messages WHERE rowid = ?", (cursor.lastrowid,)).fetchone()
+        return row[0]
+
+    def page(self, token: str, chat: str, before: Optional[int] = None,
+             limit: int = HISTORY_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Up to limit messages older than seq `before` (newest if None), oldest first."""
+        if before is None:
+            before = 2 ** 62
+        rows = self._connect().execute(
+            "SELECT seq, question, answer, sources FROM messages"
+            " WHERE token = ? AND chat = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (token, chat, before, limit),
+        ).fetchall()
+        return [
+            {"seq": seq, "question": question, "answer": answer, "sources": json.loads(sources)}
+            for seq, question, answer, sources in reversed(rows)
+        ]
@@ -0,0 +1,91 @@
+"""In-process BM25 ranking of a selected document's chunks."""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Hashable, List, Sequence
+
+from chat.cache import LRUCache
+from chat.context import estimate_tokens
+
+SELECTED_DOC_TOKEN_BUDGET = int(os.getenv("SELECTED_DOC_TOKEN_BUDGET", "4000"))
+BM25_CACHE_SIZE = int(os.getenv("BM25_CACHE_SIZE", "64"))     # Documents with a built index.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can de did do does for from had has have how i in is it its la of on or "
+    "such than that the their there these they this those to was were what when where which who why "
+    "will with would you".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of texts."""
+
+    def __init__(self, texts: Sequence[str]):
+        self._term_freqs = [Counter(tokenize(text)) for text in texts]
+        self._lengths = [sum(freqs.values()) for freqs in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        doc_freq: Counter = Counter()
+        for freqs in self._term_freqs:
+            doc_freq.update(freqs.keys())
+        n = len(texts)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+        # Postings so a query only touches the chunks that contain its terms.
+        self._postings: Dict[str, List[int]] = {}
+        for i, freqs in enumerate(self._term_freqs):
+            for term in freqs:
+                self._postings.setdefault(term, []).append(i)
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score of every text matching at least one query term."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i in self._postings[term]:
+                tf = self._term_freqs[i][term]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[i] / (self._avg_length or 1.0))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+
+_indexes = LRUCache(max_entries=BM25_CACHE_SIZE)
+
+
+def document_index(key: Hashable, chunks: Sequence[Dict[str, Any]]) -> BM25Index:
+    """The BM25 index for a document's chunks, built once per key (document id and version)."""
+    index = _indexes.get(key)
+    if index is None:
+        index = BM25Index([chunk.get("content") or "" for chunk in chunks])
+        _indexes.set(key, index)
+    return index
+
+
+def select_passages(key: Hashable, chunks: Sequence[Dict[str, Any]], question: str,
+                    budget: int = SELECTED_DOC_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+    """
+    The chunks most relevant to the question that fit in the token budget,
+    returned in document order. Chunks without a matching term rank after
+    every match, earliest first, so an unmatched question still gets the
+    start of the paper.
+    """
+    scores = document_index(key, chunks).scores(question)
+    ranked = sorted(range(len(chunks)), key=lambda i: (-scores.get(i, 0.0), i))
+    chosen = []
+    used = 0
+    for i in ranked:
+        tokens = estimate_tokens(chunks[i].get("content") or "")
+        if used + tokens > budget:
+            continue
+        chosen.append(i)
+        used += tokens
+    return [chunks[i] for i in sorted(chosen)]
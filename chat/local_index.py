@@ -0,0 +1,350 @@
+"""Optional local first-stage retrieval over the ACRES dataset.
+
+Chunks are synced incrementally from RAGFlow into an on-disk BM25 index made
+of immutable segments. Each segment is a handful of flat files:
+
+    <name>.meta      JSON: document ids and the term dictionary (term -> offset, count)
+    <name>.postings  uint32 pairs (chunk ordinal, term frequency), grouped by term
+    <name>.chunkdoc  uint32 per chunk: index into the segment's document ids
+    <name>.lengths   uint32 per chunk: token count
+    <name>.offsets   uint64 per chunk + 1: byte offsets into the store
+    <name>.store     concatenated JSON chunk records
+
+The array and store files are memory-mapped, so every backend worker on a
+host shares the same pages. manifest.json maps each document to the segment
+holding its current version; older copies are skipped at query time and
+dropped on compaction.
+"""
+
+import heapq
+import json
+import math
+import mmap
+import os
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from chat.chunks import document_version
+from chat.lexical import BM25_B, BM25_K1, tokenize
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; sync then relies on a single writer.
+    fcntl = None
+
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "remote")                    # remote, local or hybrid.
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+LOCAL_INDEX_SYNC_INTERVAL = float(os.getenv("LOCAL_INDEX_SYNC_INTERVAL", "600"))
+LOCAL_INDEX_BATCH = int(os.getenv("LOCAL_INDEX_BATCH", "200"))             # Documents per new segment.
+LOCAL_INDEX_MAX_SEGMENTS = int(os.getenv("LOCAL_INDEX_MAX_SEGMENTS", "8"))
+LOCAL_MIN_RESULTS = int(os.getenv("LOCAL_MIN_RESULTS", "5"))              # Hybrid falls back below this.
+
+STORED_FIELDS = ("id", "content", "document_id", "document_name", "dataset_id", "position")
+MANIFEST = "manifest.json"
+
+
+def _map_array(path: str, typecode: str):
+    """Memory-map a flat array file as a read-only memoryview of typecode items."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(array(typecode))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_segment(prefix: str, chunks_by_doc: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, int]]:
+    """
+    Write one segment for the given documents.
+
+    Returns:
+        Per document id, its chunk count and total token length.
+    """
+    documents = list(chunks_by_doc)
+    store = bytearray()
+    offsets = array("Q", [0])
+    chunk_doc = array("I")
+    lengths = array("I")
+    postings_by_term: Dict[str, List[int]] = {}
+    totals = {}
+    ordinal = 0
+    for doc_ordinal, doc_id in enumerate(documents):
+        doc_length = 0
+        for chunk in chunks_by_doc[doc_id]:
+            record = {field: chunk.get(field) for field in STORED_FIELDS}
+            store += json.dumps(record, ensure_ascii=False).encode("utf-8")
+            offsets.append(len(store))
+            chunk_doc.append(doc_ordinal)
+            freqs = Counter(tokenize(chunk.get("content") or ""))
+            length = sum(freqs.values())
+            lengths.append(length)
+            doc_length += length
+            for term, tf in freqs.items():
+                postings_by_term.setdefault(term, []).extend((ordinal, tf))
+            ordinal += 1
+        totals[doc_id] = {"chunks": len(chunks_by_doc[doc_id]), "length": doc_length}
+
+    postings = array("I")
+    terms = {}
+    for term, pairs in postings_by_term.items():
+        terms[term] = [len(postings) // 2, len(pairs) // 2]
+        postings.extend(pairs)
+
+    _write_atomic(f"{prefix}.store", bytes(store))
+    _write_atomic(f"{prefix}.offsets", offsets.tobytes())
+    _write_atomic(f"{prefix}.chunkdoc", chunk_doc.tobytes())
+    _write_atomic(f"{prefix}.lengths", lengths.tobytes())
+    _write_atomic(f"{prefix}.postings", postings.tobytes())
+    # The meta file is written last; a segment without one is incomplete and ignored.
+    _write_atomic(f"{prefix}.meta", json.dumps({"documents": documents, "terms": terms}).encode("utf-8"))
+    return totals
+
+
+class Segment:
+    """One immutable, memory-mapped batch of indexed chunks."""
+
+    SUFFIXES = (".meta", ".postings", ".chunkdoc", ".lengths", ".offsets", ".store")
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        with open(f"{prefix}.meta", "rb") as f:
+            meta = json.load(f)
+        self.documents: List[str] = meta["documents"]
+        self.terms: Dict[str, List[int]] = meta["terms"]
+        self.postings = _map_array(f"{prefix}.postings", "I")
+        self.chunk_doc = _map_array(f"{prefix}.chunkdoc", "I")
+        self.lengths = _map_array(f"{prefix}.lengths", "I")
+        self.offsets = _map_array(f"{prefix}.offsets", "Q")
+        with open(f"{prefix}.store", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.store = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def record(self, ordinal: int) -> Dict[str, Any]:
+        return json.loads(self.store[self.offsets[ordinal]:self.offsets[ordinal + 1]])
+
+
+def remove_segment_files(prefix: str):
+    for suffix in Segment.SUFFIXES:
+        try:
+            os.remove(prefix + suffix)
+        except FileNotFoundError:
+            pass
+
+
+class LocalIndex:
+    """
+    Reader and incremental writer for the on-disk index in `directory`.
+
+    Readers reload whenever the manifest changes on disk. Only one process
+    syncs at a time (guarded by a lock file); the others pick up its result.
+    """
+
+    def __init__(self, directory: str = LOCAL_INDEX_DIR):
+        self._dir = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._manifest: Dict[str, Any] = {"segments": [], "documents": {}, "counter": 0}
+        self._manifest_stamp: Optional[tuple] = None
+        self._segments: Dict[str, Segment] = {}
+        self._alive: Dict[str, bytearray] = {}   # segment -> 1 per document ordinal still current
+        self._chunk_total = 0
+        self._length_total = 0
+        self._sync_started = False
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._dir, name)
+
+    def _reload(self):
+        """Re-read the manifest and (un)map segments if another process changed it."""
+        path = self._path(MANIFEST)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)  # os.replace gives a new inode.
+        with self._lock:
+            if stamp == self._manifest_stamp:
+                return
+            with open(path, "rb") as f:
+                manifest = json.load(f)
+            segments = {}
+            for name in manifest["segments"]:
+                segments[name] = self._segments.get(name) or Segment(self._path(name))
+            documents = manifest["documents"]
+            alive = {}
+            for name, segment in segments.items():
+                alive[name] = bytearray(
+                    1 if documents.get(doc_id, {}).get("segment") == name else 0
+                    for doc_id in segment.documents
+                )
+            self._manifest = manifest
+            self._manifest_stamp = stamp
+            self._segments = segments
+            self._alive = alive
+            self._chunk_total = sum(doc["chunks"] for doc in documents.values())
+            self._length_total = sum(doc["length"] for doc in documents.values())
+
+    def ready(self) -> bool:
+        self._reload()
+        return self._chunk_total > 0
+
+    def search(self, question: str, limit: int = 30) -> List[Dict[str, Any]]:
+        """
+        Top `limit` chunks by BM25, as serialized chunk dicts whose similarity
+        is the score relative to the best hit.
+        """
+        self._reload()
+        with self._lock:
+            segments = list(self._segments.items())
+            alive = self._alive
+            n = self._chunk_total
+            avg_length = self._length_total / n if n else 1.0
+        if not n:
+            return []
+        terms = set(tokenize(question))
+        scores: Dict[tuple, float] = {}
+        for term in terms:
+            df = sum(segment.terms[term][1] for _, segment in segments if term in segment.terms)
+            if not df:
+                continue
+            df = min(df, n)  # Document frequency includes superseded chunks until compaction.
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for name, segment in segments:
+                entry = segment.terms.get(term)
+                if entry is None:
+                    continue
+                offset, count = entry
+                live = alive[name]
+                postings = segment.postings[offset * 2:(offset + count) * 2]
+                for j in range(0, len(postings), 2):
+                    ordinal, tf = postings[j], postings[j + 1]
+                    if not live[segment.chunk_doc[ordinal]]:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * segment.lengths[ordinal] / avg_length)
+                    key = (name, ordinal)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        if not top:
+            return []
+        best = top[0][1] or 1.0
+        by_name = dict(segments)
+        results = []
+        for (name, ordinal), score in top:
+            chunk = by_name[name].record(ordinal)
+            chunk.update(similarity=score / best, vector_similarity=None, term_similarity=score / best)
+            results.append(chunk)
+        return results
+
+    def sync(self, records: Iterable[Dict[str, Any]], fetch_chunks: Callable[[Dict[str, Any]], List[Dict[str, Any]]]) -> int:
+        """
+        Bring the index in line with the catalog records. Only documents whose
+        version changed are fetched; removed documents are dropped.
+
+        Returns:
+            The number of documents (re)indexed, or -1 if another process is syncing.
+        """
+        lock_file = open(self._path(".sync.lock"), "w")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return -1
+            self._reload()
+            with self._lock:
+                manifest = json.loads(json.dumps(self._manifest))
+            documents = manifest["documents"]
+            current = {record["id"]: record for record in records}
+            changed = [
+                record for doc_id, record in current.items()
+                if documents.get(doc_id, {}).get("version") != list(document_version(record))
+            ]
+            removed = [doc_id for doc_id in documents if doc_id not in current]
+            for doc_id in removed:
+                del documents[doc_id]
+            if removed and not changed:
+                self._commit(manifest)
+
+            # Commit in batches so an interrupted first sync keeps its progress.
+            for start in range(0, len(changed), LOCAL_INDEX_BATCH):
+                batch = changed[start:start + LOCAL_INDEX_BATCH]
+                chunks_by_doc = {record["id"]: fetch_chunks(record) for record in batch}
+                manifest["counter"] += 1
+                name = f"seg-{manifest['counter']:06d}"
+                totals = write_segment(self._path(name), chunks_by_doc)
+                for record in batch:
+                    documents[record["id"]] = dict(
+                        totals[record["id"]], version=list(document_version(record)), segment=name
+                    )
+                manifest["segments"].append(name)
+                self._commit(manifest)
+
+            if len(manifest["segments"]) > LOCAL_INDEX_MAX_SEGMENTS:
+                self._compact(manifest)
+            return len(changed)
+        finally:
+            lock_file.close()
+
+    def _commit(self, manifest: Dict[str, Any]):
+        """Drop unreferenced segments and atomically publish the manifest."""
+        referenced = {doc["segment"] for doc in manifest["documents"].values()}
+        dropped = [name for name in manifest["segments"] if name not in referenced]
+        manifest["segments"] = [name for name in manifest["segments"] if name in referenced]
+        _write_atomic(self._path(MANIFEST), json.dumps(manifest).encode("utf-8"))
+        self._reload()
+        for name in dropped:
+            remove_segment_files(self._path(name))
+
+    def _compact(self, manifest: Dict[str, Any]):
+        """Merge the live chunks of every segment into one, without re-downloading."""
+        documents = manifest["documents"]
+        chunks_by_doc: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            segments = dict(self._segments)
+        for name in manifest["segments"]:
+            segment = segments[name]
+            for ordinal in range(len(segment.chunk_doc)):
+                doc_id = segment.documents[segment.chunk_doc[ordinal]]
+                if documents.get(doc_id, {}).get("segment") == name:
+                    chunks_by_doc.setdefault(doc_id, []).append(segment.record(ordinal))
+        manifest["counter"] += 1
+        name = f"seg-{manifest['counter']:06d}"
+        write_segment(self._path(name), chunks_by_doc)
+        for doc_id in chunks_by_doc:
+            documents[doc_id]["segment"] = name
+        manifest["segments"].append(name)
+        self._commit(manifest)
+
+    def start_sync(self, get_records: Callable[[], Optional[List[Dict[str, Any]]]],
+                   fetch_chunks: Callable[[Dict[str, Any]], List[Dict[str, Any]]],
+                   interval: float = LOCAL_INDEX_SYNC_INTERVAL):
+        """Sync every `interval` seconds on a daemon thread (idempotent)."""
+        with self._lock:
+            if self._sync_started:
+                return
+            self._sync_started = True
+
+        def run():
+            while True:
+                records = get_records()
+                if records is not None:
+                    try:
+                        changed = self.sync(records, fetch_chunks)
+                        if changed > 0:
+                            print(f"Local index synced {changed} documents.")
+                    except Exception as e:
+                        print(f"Error syncing local index: {e}")
+                    time.sleep(interval)
+                else:
+                    time.sleep(5)  # Catalog not loaded yet.
+
+        threading.Thread(target=run, name="local-index-sync", daemon=True).start()
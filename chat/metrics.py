@@ -0,0 +1,160 @@
+"""Process-wide latency histograms and counters, rendered in Prometheus text format."""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# A collector returns (name, labels, value) samples read at scrape time, e.g. cache stats.
+Collector = Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]
+
+# Per-task stage durations, collected when a caller asks for them (see Metrics.stage_timings).
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """Thread-safe registry of counters and histograms."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._types: Dict[str, Tuple[str, str]] = {}                 # name -> (type, help)
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List] = {}       # -> [bucket counts, sum, count]
+        self._collectors: List[Tuple[str, str, str, Collector]] = []
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._types[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self._buckets), 0.0, 0]
+            index = bisect.bisect_left(self._buckets, value)
+            if index < len(self._buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        if name == "rag_stage_duration_seconds":
+            timings = _stage_timings.get()
+            if timings is not None:
+                stage = labels.get("stage")
+                timings[stage] = timings.get(stage, 0.0) + value
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """Time the enclosed block as rag_stage_duration_seconds{stage=...}."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("rag_stage_duration_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    @contextmanager
+    def stage_timings(self):
+        """
+        Collect the stage durations observed by this task (and the tasks and
+        threads it starts) into the yielded dict, in addition to the histograms.
+        """
+        timings: Dict[str, float] = {}
+        token = _stage_timings.set(timings)
+        try:
+            yield timings
+        finally:
+            _stage_timings.reset(token)
+
+    def add_collector(self, name: str, kind: str, help_text: str, collector: Collector):
+        self._collectors.append((name, kind, help_text, collector))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+        seen = set()
+
+        def header(name: str, kind: str, help_text: str):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, *self._types.get(name, ("counter", name)))
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), (counts, total, count) in histograms:
+            header(name, *self._types.get(name, ("histogram", name)))
+            cumulative = 0
+            for bound, bucket_count in zip(self._buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%g"' % bound
+                lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_format_labels(labels, le)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for name, kind, help_text, collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"Error collecting metric {name}: {e}")
+                continue
+            header(name, kind, help_text)
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(_labels(labels))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("rag_stage_duration_seconds", "histogram",
+                 "Duration of each stage of the question pipeline, document selection and catalog fetches.")
+metrics.describe("rag_questions_total", "counter", "Questions answered, by context type.")
+metrics.describe("rag_errors_total", "counter", "Errors by stage.")
+metrics.describe("rag_context_tokens_total", "counter", "Estimated context tokens retrieved and sent to the assistant.")
+
+_caches: Dict[str, Callable[[], Dict[str, int]]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, int]]):
+    """Export a cache's stats() (hits, misses, entries, bytes) as rag_cache_* metrics."""
+    _caches[name] = stats
+
+
+def _cache_collector(field: str, metric: str) -> Collector:
+    def collect():
+        return [(metric, {"cache": name}, stats().get(field, 0)) for name, stats in list(_caches.items())]
+    return collect
+
+
+for _field, _kind, _help in (
+    ("hits", "counter", "Cache hits."),
+    ("misses", "counter", "Cache misses."),
+    ("entries", "gauge", "Entries currently cached."),
+    ("bytes", "gauge", "Approximate bytes currently cached."),
+):
+    _metric = f"rag_cache_{_field}_total" if _kind == "counter" else f"rag_cache_{_field}"
+    metrics.add_collector(_metric, _kind, _help, _cache_collector(_field, _metric))
@@ -0,0 +1,97 @@
+"""Retrieval across several RAGFlow datasets at once.
+
+Each dataset is searched concurrently and gets RETRIEVAL_DATASET_TIMEOUT
+seconds. A dataset that fails or times out is left out of the result rather
+than failing the question. Every dataset is searched with the same hybrid
+similarity and threshold, so the ranked lists are merged by similarity with a
+k-way heap merge. Rescaling each dataset to its own best hit would rank a
+lone weak hit alongside the best answers of the others. If any chunk lacks a
+similarity, every list is scored by rank instead, which interleaves them.
+"""
+
+import asyncio
+import concurrent.futures
+import heapq
+import os
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from chat.metrics import metrics
+
+RETRIEVAL_DATASET_TIMEOUT = float(os.getenv("RETRIEVAL_DATASET_TIMEOUT", "10"))   # Seconds per dataset.
+RETRIEVAL_DATASET_WORKERS = int(os.getenv("RETRIEVAL_DATASET_WORKERS", "16"))      # Dataset searches at once.
+
+# Timed-out searches keep their thread until RAGFlow answers, so they get their own
+# pool rather than the default executor the history, session and chunk work share.
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=RETRIEVAL_DATASET_WORKERS,
+                                                  thread_name_prefix="dataset-search")
+
+Search = Callable[[str], List[Dict[str, Any]]]
+
+
+def scored(chunks: List[Dict[str, Any]], by_similarity: bool, limit: int) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    (score, chunk) pairs, best first: the similarity, or 1 - rank / limit for
+    chunks in RAGFlow's order when similarities are not available.
+    """
+    if by_similarity:
+        return sorted(((chunk["similarity"], chunk) for chunk in chunks), key=lambda pair: -pair[0])
+    return [(1 - i / max(limit, len(chunks)), chunk) for i, chunk in enumerate(chunks)]
+
+
+def merge_ranked(results: Sequence[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """
+    The `limit` best chunks of several datasets' results by score (see
+    scored), each chunk id once. Ties keep the order of `results`.
+    """
+    by_similarity = all(chunk.get("similarity") is not None for chunks in results for chunk in chunks)
+    merged = heapq.merge(*(scored(chunks, by_similarity, limit) for chunks in results), key=lambda pair: -pair[0])
+    seen = set()
+    chunks = []
+    for _, chunk in merged:
+        chunk_id = chunk.get("id")
+        if chunk_id is not None:
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+        chunks.append(chunk)
+        if len(chunks) >= limit:
+            break
+    return chunks
+
+
+async def retrieve_datasets(dataset_ids: Sequence[str], search: Search, limit: int,
+                            timeout: float = RETRIEVAL_DATASET_TIMEOUT) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Run search(dataset_id) for every dataset on the dataset pool and merge the
+    results. Returns (chunks, complete), where complete is False if some
+    dataset was left out. Raises only if every dataset failed. A timed-out
+    search keeps its worker thread until RAGFlow responds, but is no longer
+    waited for.
+    """
+    loop = asyncio.get_running_loop()
+    if len(dataset_ids) == 1:
+        return await loop.run_in_executor(_executor, search, dataset_ids[0]), True
+
+    async def one(dataset_id: str) -> List[Dict[str, Any]]:
+        with metrics.span("retrieval_dataset", dataset=dataset_id):
+            return await asyncio.wait_for(loop.run_in_executor(_executor, search, dataset_id), timeout)
+
+    outcomes = await asyncio.gather(*(one(dataset_id) for dataset_id in dataset_ids), return_exceptions=True)
+    results = []
+    errors = []
+    for dataset_id, outcome in zip(dataset_ids, outcomes):
+        if isinstance(outcome, BaseException):
+            reason = "timeout" if isinstance(outcome, asyncio.TimeoutError) else "error"
+            print(f"Retrieval from dataset {dataset_id} failed ({reason}): {outcome!r}")
+            metrics.inc("rag_dataset_retrievals_total", dataset=dataset_id, outcome=reason)
+            errors.append(outcome)
+        else:
+            metrics.inc("rag_dataset_retrievals_total", dataset=dataset_id, outcome="ok")
+            results.append(outcome)
+    if not results:
+        raise errors[0]
+    return merge_ranked(results, limit), not errors
+
+
+metrics.describe("rag_dataset_retrievals_total", "counter",
+                 "Per-dataset retrievals when several datasets are searched, by outcome (ok, timeout, error).")
@@ -0,0 +1,76 @@
+"""Clean-up of assistant answers: citation markers and repeated tails."""
+
+import re
+from typing import List
+
+# RAGFlow citation markers look like "##12$$".
+MARKER = re.compile(r"##\d+\$\$")
+# A suffix that could still grow into a marker once the next fragment arrives.
+PARTIAL_MARKER = re.compile(r"#(?:#(?:\d+\$?)?)?$")
+
+
+def _z_function(s: str) -> List[int]:
+    """z[i] is the length of the longest common prefix of s and s[i:]."""
+    n = len(s)
+    z = [0] * n
+    if n:
+        z[0] = n
+    left = right = 0
+    for i in range(1, n):
+        if i < right:
+            z[i] = min(right - i, z[i - left])
+        while i + z[i] < n and s[z[i]] == s[i + z[i]]:
+            z[i] += 1
+        if i + z[i] > right:
+            left, right = i, i + z[i]
+    return z
+
+
+def remove_duplicate_trailing(text: str, min_length: int = 5) -> str:
+    """
+    Drop the longest tail (of at least min_length chars) that is immediately
+    repeated, e.g. "...abcdefabcdef" -> "...abcdef". Runs in linear time: the
+    tail of length l repeats exactly when the reversed text has a border of
+    length >= l at offset l.
+    """
+    n = len(text)
+    if n < 2 * min_length:
+        return text
+    z = _z_function(text[::-1])
+    for length in range(n // 2, min_length - 1, -1):
+        if z[length] >= length:
+            return text[:-length]
+    return text
+
+
+def clean_response(text: str) -> str:
+    cleaned = MARKER.sub("", text)
+    return remove_duplicate_trailing(cleaned, min_length=5)
+
+
+class StreamingCleaner:
+    """
+    Strips citation markers from a streamed answer fragment by fragment.
+
+    A fragment ending in what may be the start of a marker is held back until
+    the next fragment shows whether it is one, so markers split across stream
+    messages never reach the UI.
+    """
+
+    def __init__(self):
+        self._carry = ""
+
+    def feed(self, fragment: str) -> str:
+        """Return the part of carry + fragment that is safe to display."""
+        text = MARKER.sub("", self._carry + fragment)
+        match = PARTIAL_MARKER.search(text)
+        if match:
+            self._carry = text[match.start():]
+            return text[:match.start()]
+        self._carry = ""
+        return text
+
+    def finish(self) -> str:
+        """Release whatever was held back once the stream has ended."""
+        tail, self._carry = self._carry, ""
+        return tail
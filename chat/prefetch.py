@@ -0,0 +1,146 @@
+"""Speculative knowledge1 retrieval for questions that are still being typed.
+
+The question box sends its text as the user types. Once the text is long
+enough, retrieval starts in the background. On submit, a prefetch whose words
+match or closely overlap the final question replaces a fresh retrieval; any
+other prefetch is dropped. Each client has at most PREFETCH_PER_CLIENT
+retrievals in flight. Text that arrives while the client is at that cap is
+held, and only the newest held text starts when a slot frees up.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from chat.lexical import tokenize
+from chat.metrics import metrics
+from chat.retrieval import normalize_question
+
+PREFETCH_MIN_CHARS = int(os.getenv("PREFETCH_MIN_CHARS", "12"))
+PREFETCH_PER_CLIENT = int(os.getenv("PREFETCH_PER_CLIENT", "1"))       # Concurrent prefetches per client; 0 disables.
+PREFETCH_MIN_OVERLAP = float(os.getenv("PREFETCH_MIN_OVERLAP", "0.8"))  # Jaccard similarity of content words.
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "60"))
+PREFETCH_KEEP = 4    # Most recent prefetches remembered per client; older ones are dropped.
+
+Retrieve = Callable[[str, str], Awaitable[List[Dict[str, Any]]]]
+
+
+def overlap(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class Prefetch:
+    def __init__(self, text: str, task: "asyncio.Future"):
+        self.normalized = normalize_question(text)
+        self.words = frozenset(tokenize(self.normalized))
+        self.task = task
+        self.started = time.monotonic()
+
+
+class _Client:
+    def __init__(self):
+        self.prefetches: List[Prefetch] = []
+        self.held: Optional[str] = None       # Newest text that arrived while at the cap.
+        self.touched = time.monotonic()
+
+
+class Prefetcher:
+    """Per-client speculative retrievals. Use it from the backend's event loop."""
+
+    def __init__(self, retrieve: Retrieve, per_client: int = PREFETCH_PER_CLIENT,
+                 min_chars: int = PREFETCH_MIN_CHARS, min_overlap: float = PREFETCH_MIN_OVERLAP,
+                 ttl: float = PREFETCH_TTL):
+        self._retrieve = retrieve
+        self._per_client = per_client
+        self._min_chars = min_chars
+        self._min_overlap = min_overlap
+        self._ttl = ttl
+        self._clients: Dict[str, _Client] = {}
+
+    def __len__(self) -> int:
+        return sum(len(client.prefetches) for client in self._clients.values())
+
+    def start(self, token: str, text: str):
+        """Start retrieving for partly typed text, unless it adds nothing or the client is at its cap."""
+        if self._per_client <= 0 or len(normalize_question(text)) < self._min_chars:
+            return
+        self._expire()
+        client = self._clients.setdefault(token, _Client())
+        client.touched = time.monotonic()
+        normalized = normalize_question(text)
+        if any(prefetch.normalized == normalized for prefetch in client.prefetches):
+            return
+        if sum(not prefetch.task.done() for prefetch in client.prefetches) >= self._per_client:
+            client.held = text
+            metrics.inc("rag_prefetch_total", outcome="held")
+            return
+        client.held = None
+        task = asyncio.ensure_future(self._run(token, text))
+        client.prefetches.append(Prefetch(text, task))
+        task.add_done_callback(lambda _: self._start_held(token))
+        metrics.inc("rag_prefetch_total", outcome="started")
+        for stale in client.prefetches[:-PREFETCH_KEEP]:
+            stale.task.cancel()
+            metrics.inc("rag_prefetch_total", outcome="dropped")
+        del client.prefetches[:-PREFETCH_KEEP]
+
+    def take(self, token: str, question: str) -> Optional["asyncio.Future"]:
+        """
+        Claim the prefetch matching the submitted question, if any, and drop
+        the client's other prefetches. The future resolves to the chunks, or
+        None if the prefetch failed.
+        """
+        client = self._clients.pop(token, None)
+        if client is None:
+            return None
+        normalized = normalize_question(question)
+        words = frozenset(tokenize(normalized))
+        best, best_score = None, 0.0
+        for prefetch in client.prefetches:
+            score = 1.0 if prefetch.normalized == normalized else overlap(prefetch.words, words)
+            # Prefer the closest match; on ties the most recent text.
+            if score >= self._min_overlap and score >= best_score:
+                best, best_score = prefetch, score
+        for prefetch in client.prefetches:
+            if prefetch is not best:
+                prefetch.task.cancel()
+                metrics.inc("rag_prefetch_total", outcome="dropped")
+        if best is None:
+            return None
+        metrics.inc("rag_prefetch_total", outcome="reused")
+        return best.task
+
+    def discard(self, token: str):
+        """Drop a client's prefetches, e.g. when it selects a document."""
+        client = self._clients.pop(token, None)
+        for prefetch in client.prefetches if client else ():
+            prefetch.task.cancel()
+
+    async def _run(self, token: str, text: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            return await self._retrieve(text, token)
+        except Exception as e:
+            print(f"Error prefetching retrieval: {e}")
+            return None
+
+    def _start_held(self, token: str):
+        client = self._clients.get(token)
+        if client is not None and client.held is not None:
+            self.start(token, client.held)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self._ttl
+        for token, client in list(self._clients.items()):
+            client.prefetches = [
+                prefetch for prefetch in client.prefetches
+                if not prefetch.task.done() or prefetch.started >= cutoff
+            ]
+            if not client.prefetches and client.touched < cutoff:
+                del self._clients[token]
+
+
+metrics.describe("rag_prefetch_total", "counter",
+                 "Speculative retrievals for questions being typed, by outcome (started, held, reused, dropped).")
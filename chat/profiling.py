@@ -0,0 +1,294 @@
+"""Opt-in profiler for the state each event serializes and pushes to the browser.
+
+Set STATE_PROFILE_DIR to turn it on. For every state update it records, per
+event handler and per var:
+
+- delta bytes: the JSON size of the var in the delta sent over the websocket;
+- state bytes: the JSON size of the var's current value, which is what Reflex
+  serializes and stores (in Redis, when configured) between events;
+- computed var evaluations, recomputes and their wall time.
+
+Every STATE_PROFILE_INTERVAL seconds, and at exit, the totals are written to
+STATE_PROFILE_DIR as state_profile.json, plus state_profile_bytes.folded and
+state_profile_time.folded. The .folded files hold `handler;state;var value`
+lines for flamegraph.pl or speedscope. Profiling re-serializes the state on
+every update, so it is for development only.
+"""
+
+import atexit
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+STATE_PROFILE_DIR = os.getenv("STATE_PROFILE_DIR", "")                      # Empty disables profiling.
+STATE_PROFILE_INTERVAL = float(os.getenv("STATE_PROFILE_INTERVAL", "30"))   # Seconds between report writes.
+
+UNATTRIBUTED = "(no handler)"
+
+# The event handler whose updates are being recorded. Handlers set it and leave
+# it set, because Reflex computes the delta after the handler has returned.
+_handler: ContextVar[Optional[str]] = ContextVar("state_profile_handler", default=None)
+_computed_names: Dict[int, str] = {}    # id(ComputedVar) -> var name.
+
+try:
+    from reflex.utils.format import json_dumps as _json_dumps
+except ImportError:
+    def _json_dumps(value: Any) -> str:
+        return json.dumps(value, default=str)
+
+
+def payload_bytes(value: Any) -> int:
+    """Bytes of a value serialized the way Reflex sends it."""
+    try:
+        return len(_json_dumps(value).encode("utf-8"))
+    except Exception:
+        return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+def _var_name(name: str) -> str:
+    # Newer Reflex versions suffix var names in deltas.
+    return name[:-len("_rx_state_")] if name.endswith("_rx_state_") else name
+
+
+class _VarStats:
+    __slots__ = ("updates", "delta_bytes", "max_delta_bytes", "state_bytes", "max_state_bytes",
+                 "evaluations", "recomputes", "recompute_seconds")
+
+    def __init__(self):
+        self.updates = 0
+        self.delta_bytes = 0
+        self.max_delta_bytes = 0
+        self.state_bytes = 0
+        self.max_state_bytes = 0
+        self.evaluations = 0
+        self.recomputes = 0
+        self.recompute_seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class StateProfiler:
+    """Aggregates per (handler, state, var) numbers; thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vars: Dict[Tuple[str, str, str], _VarStats] = {}
+        self._handlers: Dict[str, Dict[str, float]] = {}
+
+    def _stats(self, handler: str, state: str, var: str) -> _VarStats:
+        key = (handler, state, var)
+        stats = self._vars.get(key)
+        if stats is None:
+            stats = self._vars[key] = _VarStats()
+        return stats
+
+    def record_delta(self, root, delta: Dict[str, Dict[str, Any]]):
+        """Record one delta produced by the root state `root`."""
+        handler = _handler.get() or UNATTRIBUTED
+        states = {state.get_full_name(): state for state in _walk(root)}
+        sizes = []
+        for state_name, values in delta.items():
+            state = states.get(state_name)
+            stored = _state_sizes(state) if state is not None else {}
+            for name, value in values.items():
+                var = _var_name(name)
+                sizes.append((state_name, var, payload_bytes(value), stored.get(var, 0)))
+        total = payload_bytes(delta)
+        with self._lock:
+            summary = self._handlers.setdefault(handler, {"updates": 0, "delta_bytes": 0, "max_delta_bytes": 0})
+            summary["updates"] += 1
+            summary["delta_bytes"] += total
+            summary["max_delta_bytes"] = max(summary["max_delta_bytes"], total)
+            for state_name, var, delta_size, state_size in sizes:
+                stats = self._stats(handler, state_name, var)
+                stats.updates += 1
+                stats.delta_bytes += delta_size
+                stats.max_delta_bytes = max(stats.max_delta_bytes, delta_size)
+                stats.state_bytes = state_size
+                stats.max_state_bytes = max(stats.max_state_bytes, state_size)
+
+    def record_evaluation(self, state_name: str, var: str, seconds: float, recomputed: bool):
+        with self._lock:
+            stats = self._stats(_handler.get() or UNATTRIBUTED, state_name, var)
+            stats.evaluations += 1
+            if recomputed:
+                stats.recomputes += 1
+                stats.recompute_seconds += seconds
+
+    def report(self) -> Dict[str, Any]:
+        """Totals per handler and per var, heaviest first."""
+        with self._lock:
+            handlers = {name: dict(summary) for name, summary in self._handlers.items()}
+            rows = [(key, stats.to_dict()) for key, stats in self._vars.items()]
+        by_var: Dict[str, Dict[str, Any]] = {}
+        for (handler, state_name, var), stats in rows:
+            handlers.setdefault(handler, {"updates": 0, "delta_bytes": 0, "max_delta_bytes": 0})
+            handlers[handler].setdefault("vars", {})[f"{state_name}.{var}"] = stats
+            total = by_var.setdefault(f"{state_name}.{var}", _VarStats().to_dict())
+            for field, value in stats.items():
+                if field.startswith("max_") or field == "state_bytes":
+                    total[field] = max(total[field], value)
+                else:
+                    total[field] += value
+        heaviest = lambda item: -item[1]["delta_bytes"]
+        return {
+            "handlers": dict(sorted(handlers.items(), key=heaviest)),
+            "vars": dict(sorted(by_var.items(), key=heaviest)),
+        }
+
+    def folded(self, field: str, scale: float = 1.0) -> str:
+        """`handler;state;var value` lines for flamegraph tools; zero values are left out."""
+        with self._lock:
+            rows = [(key, getattr(stats, field)) for key, stats in self._vars.items()]
+        lines = [f"{handler};{state_name};{var} {round(value * scale)}"
+                 for (handler, state_name, var), value in sorted(rows) if round(value * scale) > 0]
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        outputs = {
+            "state_profile.json": json.dumps(self.report(), indent=2),
+            "state_profile_bytes.folded": self.folded("delta_bytes"),
+            "state_profile_time.folded": self.folded("recompute_seconds", scale=1e6),   # Microseconds.
+        }
+        for name, text in outputs.items():
+            path = os.path.join(directory, name)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(path + ".tmp", path)
+
+
+profiler = StateProfiler()
+
+
+def _walk(root) -> Iterator[Any]:
+    stack = [root]
+    while stack:
+        state = stack.pop()
+        yield state
+        stack.extend(state.substates.values())
+
+
+def _state_sizes(state) -> Dict[str, int]:
+    """Serialized size of each stored var of a state: base vars and backend vars."""
+    cls = type(state)
+    names = list(getattr(cls, "base_vars", {})) + list(getattr(cls, "backend_vars", {}))
+    sizes = {}
+    for name in names:
+        try:
+            sizes[name] = payload_bytes(getattr(state, name))
+        except Exception:
+            continue
+    return sizes
+
+
+def _attributed(name: str, fn):
+    """Wrap an event handler function so updates it causes are recorded under `name`."""
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def handler(*args, **kwargs):
+            _handler.set(name)
+            async for update in fn(*args, **kwargs):
+                yield update
+    elif inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def handler(*args, **kwargs):
+            _handler.set(name)
+            return await fn(*args, **kwargs)
+    elif inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def handler(*args, **kwargs):
+            _handler.set(name)
+            return (yield from fn(*args, **kwargs))
+    else:
+        @functools.wraps(fn)
+        def handler(*args, **kwargs):
+            _handler.set(name)
+            return fn(*args, **kwargs)
+    return handler
+
+
+def _timed_get(get):
+    """Wrap ComputedVar.__get__ to time evaluations on state instances."""
+
+    @functools.wraps(get)
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return get(self, instance, owner)
+        cache_attr = getattr(self, "_cache_attr", None)
+        cached = bool(getattr(self, "_cache", True) and cache_attr and hasattr(instance, cache_attr))
+        start = time.perf_counter()
+        try:
+            return get(self, instance, owner)
+        finally:
+            profiler.record_evaluation(type(instance).get_full_name(), _computed_names.get(id(self), "?"),
+                                       time.perf_counter() - start, recomputed=not cached)
+
+    __get__._state_profiled = True
+    return __get__
+
+
+def _state_classes(root_cls) -> Iterator[type]:
+    stack = [root_cls]
+    while stack:
+        cls = stack.pop()
+        yield cls
+        stack.extend(cls.__subclasses__())
+
+
+def install(root_cls, directory: str = STATE_PROFILE_DIR, interval: float = STATE_PROFILE_INTERVAL) -> bool:
+    """
+    Instrument root_cls (normally rx.State) and all its substates, and start
+    writing reports to directory. Call before the app is compiled. Does
+    nothing when directory is empty; returns whether profiling is on.
+    """
+    if not directory or getattr(root_cls, "_state_profiled", False):
+        return bool(directory)
+    root_cls._state_profiled = True
+
+    get_delta = root_cls.get_delta
+
+    def profiled_get_delta(self):
+        delta = get_delta(self)
+        # Substates' deltas are part of the root's; record each update once.
+        if self.parent_state is None:
+            try:
+                profiler.record_delta(self, delta)
+            except Exception as e:
+                print(f"Error profiling state delta: {e}")
+        return delta
+
+    root_cls.get_delta = profiled_get_delta
+
+    patched = set()
+    for cls in _state_classes(root_cls):
+        for name, handler in list(getattr(cls, "event_handlers", {}).items()):
+            if not getattr(handler.fn, "_state_profiled", False):
+                fn = _attributed(f"{cls.get_full_name()}.{name}", handler.fn)
+                fn._state_profiled = True
+                object.__setattr__(handler, "fn", fn)
+        for name, computed in getattr(cls, "computed_vars", {}).items():
+            _computed_names[id(computed)] = name
+            var_cls = type(computed)
+            if var_cls not in patched and not getattr(var_cls.__get__, "_state_profiled", False):
+                var_cls.__get__ = _timed_get(var_cls.__get__)
+                patched.add(var_cls)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                profiler.write(directory)
+            except Exception as e:
+                print(f"Error writing state profile: {e}")
+
+    threading.Thread(target=run, name="state-profile", daemon=True).start()
+    atexit.register(profiler.write, directory)
+    print(f"State profiling on; writing reports to {directory}")
+    return True
@@ -0,0 +1,93 @@
+"""Cache of RAGFlow retrieval results keyed by normalized question text."""
+
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from chat.cache import LRUCache
+from chat.shared_cache import SharedTier
+
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Fold case, width and punctuation so trivially different questions share a key."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class RetrievalCache:
+    """
+    TTL + LRU cache of serialized retrieval chunks.
+
+    Keys combine the normalized question, dataset ids and retrieval parameters.
+    Each entry remembers the dataset version it was computed against and is
+    discarded once the catalog reports a different version. With a shared
+    tier, entries are also written to Redis for the other replicas; get()
+    stays local and get_shared() is the blocking second level.
+    """
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL,
+                 shared: Optional[SharedTier] = None):
+        self._entries = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.shared = shared
+        if shared is not None:
+            shared.subscribe("retrieval", lambda _: self._entries.clear())
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(question: str, dataset_ids: Iterable[str], params: Dict[str, Any]) -> Hashable:
+        return (
+            normalize_question(question),
+            tuple(sorted(dataset_ids)),
+            json.dumps(params, sort_keys=True, default=str),
+        )
+
+    def get(self, key: Hashable, dataset_version: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        hit = entry is not None and entry[0] == dataset_version
+        if entry is not None and not hit:
+            self._entries.pop(key)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry[1] if hit else None
+
+    def get_shared(self, key: Hashable, dataset_version: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        """Look in the shared tier after a local miss; blocking, so call it from a worker thread."""
+        if self.shared is None:
+            return None
+        entry = self.shared.get("retrieval", key)
+        if entry is None or entry["version"] != dataset_version:
+            return None
+        self._entries.set(key, (dataset_version, entry["chunks"]))
+        return entry["chunks"]
+
+    def set(self, key: Hashable, dataset_version: Optional[str], chunks: List[Dict[str, Any]]):
+        self._entries.set(key, (dataset_version, chunks))
+        if self.shared is not None:
+            self.shared.put("retrieval", key, {"version": dataset_version, "chunks": chunks})
+
+    def clear(self):
+        """Drop every entry, on all replicas."""
+        self._entries.clear()
+        if self.shared is not None:
+            self.shared.invalidate("retrieval")
+
+    def stats(self) -> Dict[str, int]:
+        stats = self._entries.stats()
+        stats["hits"] = self.hits
+        stats["misses"] = self.misses
+        return stats
@@ -0,0 +1,148 @@
+"""Backend-wide admission control for RAGFlow retrievals and generations.
+
+Each FairLimiter caps how many operations run at once. Callers beyond the
+cap wait in a bounded queue served round-robin across clients, so one busy
+client cannot starve the others. When the queue is full, callers are
+rejected immediately with QueueFull.
+
+Limiters must be used from the backend's event loop.
+"""
+
+import asyncio
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+
+from chat.metrics import metrics
+
+MAX_CONCURRENT_RETRIEVALS = int(os.getenv("MAX_CONCURRENT_RETRIEVALS", "8"))
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", "4"))
+MAX_QUEUED_QUESTIONS = int(os.getenv("MAX_QUEUED_QUESTIONS", "50"))
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "1.0"))   # Seconds between position updates.
+
+BUSY_MESSAGE = "The assistant is busy right now. Please try again in a moment."
+
+
+class QueueFull(Exception):
+    """Raised when a limiter's wait queue has no room for another caller."""
+
+
+class Ticket:
+    """A caller's place in a FairLimiter: either granted a slot or waiting for one."""
+
+    def __init__(self, limiter: "FairLimiter", client: str):
+        self.client = client
+        self._limiter = limiter
+        self._granted = asyncio.get_running_loop().create_future()
+        self._released = False
+
+    @property
+    def granted(self) -> bool:
+        return self._granted.done() and not self._granted.cancelled()
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to timeout seconds for a slot; returns whether it was granted."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self._granted), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def position(self) -> int:
+        """Approximate 1-based position in the queue; 0 once granted."""
+        return self._limiter.position(self)
+
+    def release(self):
+        """Give the slot back, or leave the queue if still waiting. Idempotent."""
+        if not self._released:
+            self._released = True
+            self._limiter._leave(self)
+
+
+class FairLimiter:
+    def __init__(self, name: str, limit: int, max_waiting: int = MAX_QUEUED_QUESTIONS):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.waiting = 0
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()  # Rotation order of clients.
+
+    def enter(self, client: str) -> Ticket:
+        """Take a slot or a place in the queue; raises QueueFull if neither is available."""
+        ticket = Ticket(self, client)
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            ticket._granted.set_result(True)
+            return ticket
+        if self.waiting >= self.max_waiting:
+            metrics.inc("rag_rejected_total", limiter=self.name)
+            raise QueueFull(BUSY_MESSAGE)
+        self._queues.setdefault(client, deque()).append(ticket)
+        self.waiting += 1
+        return ticket
+
+    @asynccontextmanager
+    async def slot(self, client: str):
+        """Hold a slot for the duration of the block."""
+        ticket = self.enter(client)
+        try:
+            await ticket.wait()
+            yield
+        finally:
+            ticket.release()
+
+    def position(self, ticket: Ticket) -> int:
+        queue = self._queues.get(ticket.client)
+        if not queue or ticket not in queue:
+            return 0
+        depth = queue.index(ticket)
+        # Round-robin: clients ahead of ours in the rotation get one more turn first.
+        ahead = depth
+        before = True
+        for client, other in self._queues.items():
+            if client == ticket.client:
+                before = False
+                continue
+            ahead += min(len(other), depth + 1 if before else depth)
+        return ahead + 1
+
+    def _leave(self, ticket: Ticket):
+        if ticket.granted:
+            self.active -= 1
+            self._grant_next()
+            return
+        queue = self._queues.get(ticket.client)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self.waiting -= 1
+            if not queue:
+                del self._queues[ticket.client]
+        ticket._granted.cancel()
+
+    def _grant_next(self):
+        while self.active < self.limit and self._queues:
+            client, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self.waiting -= 1
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            self.active += 1
+            ticket._granted.set_result(True)
+
+
+retrieval_limiter = FairLimiter("retrieval", MAX_CONCURRENT_RETRIEVALS)
+generation_limiter = FairLimiter("generation", MAX_CONCURRENT_GENERATIONS)
+
+metrics.describe("rag_rejected_total", "counter", "Questions rejected because a wait queue was full.")
+metrics.add_collector(
+    "rag_limiter_slots", "gauge", "Admission control slots in use and callers waiting, per limiter.",
+    lambda: [
+        ("rag_limiter_slots", {"limiter": limiter.name, "state": state}, value)
+        for limiter in (retrieval_limiter, generation_limiter)
+        for state, value in (("active", limiter.active), ("waiting", limiter.waiting))
+    ],
+)
@@ -0,0 +1,178 @@
+"""Pool of pre-created RAGFlow chat sessions leased to clients on demand."""
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+SESSION_POOL_SIZE = int(os.getenv("SESSION_POOL_SIZE", "4"))                # Spare sessions kept ready.
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))     # Seconds before a lease is reaped.
+SESSION_REAP_INTERVAL = float(os.getenv("SESSION_REAP_INTERVAL", "60"))
+
+
+class _Lease:
+    __slots__ = ("session", "last_used", "answered")
+
+    def __init__(self, now: float):
+        self.session: Any = None       # Leased on the first acquire().
+        self.last_used = now
+        self.answered = False          # Whether the client has had an answer in this conversation.
+
+
+class SessionManager:
+    """
+    Hands out one RAGFlow session per client, created lazily on the first
+    question. Spare sessions are created ahead of time in the background, and
+    sessions idle for longer than the timeout are deleted on the server.
+
+    RAGFlow answers depend on the session's earlier turns, so the manager also
+    tracks whether a client's conversation is still fresh (see chat.answers).
+    """
+
+    def __init__(self, get_assistant: Callable[[], Any], pool_size: int = SESSION_POOL_SIZE,
+                 idle_timeout: float = SESSION_IDLE_TIMEOUT):
+        self._get_assistant = get_assistant
+        self._pool_size = pool_size
+        self._idle_timeout = idle_timeout
+        self._pool: Deque[Any] = deque()
+        self._leases: Dict[str, _Lease] = {}   # client key -> lease
+        self._lock = threading.Lock()
+        self._replenishing = False
+        self._started = False
+
+    def start(self):
+        """Fill the spare pool and start the reaper thread (idempotent)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="session-reaper", daemon=True).start()
+
+    def acquire(self, key: str):
+        """Return the session leased to key, leasing a new one if needed. Blocking."""
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease.session is not None:
+                lease.last_used = now
+                return lease.session
+            session = self._pool.popleft() if self._pool else None
+        if session is None:
+            session = self._get_assistant().create_session()
+        with self._lock:
+            lease = self._leases.setdefault(key, _Lease(now))
+            # Another request for the same key may have won the race.
+            if lease.session is not None:
+                self._pool.append(session)
+            else:
+                lease.session = session
+            lease.last_used = now
+            session = lease.session
+        self._replenish_in_background()
+        return session
+
+    def is_fresh(self, key: str) -> bool:
+        """Whether the client's conversation is empty, so its next answer depends only on the question."""
+        with self._lock:
+            lease = self._leases.get(key)
+            return lease is None or not lease.answered
+
+    def answered(self, key: str):
+        """
+        Note that the client has had an answer, asked on its own session or
+        shared from another one; its conversation is no longer fresh.
+        """
+        with self._lock:
+            lease = self._leases.setdefault(key, _Lease(time.monotonic()))
+            lease.answered = True
+            lease.last_used = time.monotonic()
+
+    def release(self, key: str):
+        """Forget a client's session and delete it on the server."""
+        with self._lock:
+            lease = self._leases.pop(key, None)
+        if lease is not None and lease.session is not None:
+            self._delete([lease.session])
+
+    def reap(self) -> int:
+        """Delete sessions whose client has been idle past the timeout."""
+        cutoff = time.monotonic() - self._idle_timeout
+        with self._lock:
+            idle = [key for key, lease in self._leases.items() if lease.last_used < cutoff]
+            sessions = [self._leases.pop(key).session for key in idle]
+        sessions = [session for session in sessions if session is not None]
+        self._delete(sessions)
+        return len(sessions)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            leased = sum(lease.session is not None for lease in self._leases.values())
+        return {"leased": leased, "spare": len(self._pool)}
+
+    def _replenish(self):
+        try:
+            while len(self._pool) < self._pool_size:
+                session = self._get_assistant().create_session()
+                with self._lock:
+                    self._pool.append(session)
+        except Exception as e:
+            print(f"Error pre-creating chat session: {e}")
+        finally:
+            with self._lock:
+                self._replenishing = False
+
+    def _replenish_in_background(self):
+        with self._lock:
+            if self._replenishing or len(self._pool) >= self._pool_size:
+                return
+            self._replenishing = True
+        threading.Thread(target=self._replenish, name="session-pool", daemon=True).start()
+
+    def _delete(self, sessions: List[Any]):
+        if not sessions:
+            return
+        try:
+            self._get_assistant().delete_sessions(ids=[session.id for session in sessions])
+        except Exception as e:
+            print(f"Error deleting idle chat sessions: {e}")
+
+    def _run(self):
+        self._replenish_in_background()
+        while True:
+            time.sleep(SESSION_REAP_INTERVAL)
+            self.reap()
+            self._replenish_in_background()
+
+
+class AskLocks:
+    """
+    One asyncio lock per client session, so a session is asked one question
+    at a time: a shared answer may still be streaming on a session after its
+    owner stopped reading it. Use it from the event loop.
+    """
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    async def acquire(self, key: str, cancel: asyncio.Event) -> Optional[asyncio.Lock]:
+        """Wait for key's lock and return it held, or None if cancel is set first."""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        acquired = asyncio.ensure_future(lock.acquire())
+        cancelled = asyncio.ensure_future(cancel.wait())
+        await asyncio.wait((acquired, cancelled), return_when=asyncio.FIRST_COMPLETED)
+        cancelled.cancel()
+        if not acquired.done():
+            # The lock may still be granted before the cancellation lands.
+            acquired.cancel()
+            await asyncio.wait((acquired,))
+        if acquired.cancelled():
+            return None
+        if cancel.is_set():
+            lock.release()
+            return None
+        return lock
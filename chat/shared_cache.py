@@ -0,0 +1,177 @@
+"""Redis tier shared by every backend replica, behind the in-process caches.
+
+Entries are JSON compressed with zlib. Writes happen on a background thread,
+so callers never wait on Redis to store. Reads block, so call them from a
+worker thread. Invalidations go out over pub/sub, and every replica drops the
+matching local entries. If Redis cannot be reached, reads count as misses and
+writes are dropped for SHARED_CACHE_BACKOFF seconds. The caches then keep
+working per process.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+try:
+    import redis
+except ImportError:  # Installed with Reflex; only needed when a shared cache URL is set.
+    redis = None
+
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", os.getenv("REDIS_URL", ""))   # Empty disables the shared tier.
+SHARED_CACHE_PREFIX = os.getenv("SHARED_CACHE_PREFIX", "rag-cache:")
+SHARED_CACHE_TTL = int(os.getenv("SHARED_CACHE_TTL", "3600"))                  # Seconds an entry lives in Redis.
+SHARED_CACHE_MAX_ENTRY = int(os.getenv("SHARED_CACHE_MAX_ENTRY", str(16 * 1024 * 1024)))  # Compressed bytes.
+SHARED_CACHE_BACKOFF = float(os.getenv("SHARED_CACHE_BACKOFF", "30"))          # Seconds to skip Redis after an error.
+
+Listener = Callable[[Optional[str]], None]
+
+
+def encode(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, separators=(",", ":"), default=str).encode("utf-8"), 6)
+
+
+def decode(data: bytes) -> Any:
+    return json.loads(zlib.decompress(data))
+
+
+def key_digest(key: Hashable) -> str:
+    """Short, stable Redis key for any JSON-serializable cache key."""
+    if isinstance(key, str):
+        return key
+    return hashlib.sha1(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+
+class SharedTier:
+    def __init__(self, url: str, prefix: str = SHARED_CACHE_PREFIX, ttl: int = SHARED_CACHE_TTL):
+        self._client = redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        self._prefix = prefix
+        self._ttl = ttl
+        self._channel = f"{prefix}invalidate"
+        self._origin = uuid.uuid4().hex          # Skips this process's own invalidations.
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache")
+        self._listeners: Dict[str, List[Listener]] = {}
+        self._listening = False
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    def _key(self, namespace: str, key: Hashable) -> str:
+        return f"{self._prefix}{namespace}:{key_digest(key)}"
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _failed(self, action: str, error: Exception):
+        self.errors += 1
+        if self._available():
+            print(f"Shared cache unavailable ({action}): {error}")
+        self._down_until = time.monotonic() + SHARED_CACHE_BACKOFF
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        """Blocking read; None on a miss or when Redis is unavailable."""
+        if not self._available():
+            self.misses += 1
+            return None
+        try:
+            data = self._client.get(self._key(namespace, key))
+        except Exception as e:
+            self._failed("get", e)
+            data = None
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return decode(data)
+
+    def put(self, namespace: str, key: Hashable, value: Any, ttl: Optional[int] = None):
+        """Store in the background; oversized values are not shared."""
+        if not self._available():
+            return
+
+        def write():
+            data = encode(value)
+            if len(data) > SHARED_CACHE_MAX_ENTRY:
+                return
+            try:
+                self._client.set(self._key(namespace, key), data, ex=ttl or self._ttl)
+            except Exception as e:
+                self._failed("put", e)
+
+        self._writer.submit(write)
+
+    def invalidate(self, namespace: str, key: Optional[Hashable] = None):
+        """
+        Tell every other replica to drop its local copy of key, or of the whole
+        namespace when key is None. The shared entry for key is deleted too.
+        """
+        if not self._available():
+            return
+        digest = key_digest(key) if key is not None else None
+
+        def send():
+            try:
+                if digest is not None:
+                    self._client.delete(f"{self._prefix}{namespace}:{digest}")
+                message = {"origin": self._origin, "namespace": namespace, "key": digest}
+                self._client.publish(self._channel, json.dumps(message))
+            except Exception as e:
+                self._failed("invalidate", e)
+
+        self._writer.submit(send)
+
+    def subscribe(self, namespace: str, listener: Listener):
+        """
+        Call listener(key digest or None) when another replica invalidates
+        this namespace. Listeners run on the subscriber thread.
+        """
+        with self._lock:
+            self._listeners.setdefault(namespace, []).append(listener)
+            if self._listening:
+                return
+            self._listening = True
+        threading.Thread(target=self._listen, name="shared-cache-invalidations", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    self._dispatch(message.get("data"))
+            except Exception as e:
+                self._failed("subscribe", e)
+                time.sleep(SHARED_CACHE_BACKOFF)
+
+    def _dispatch(self, data: Any):
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if message.get("origin") == self._origin:
+            return
+        for listener in list(self._listeners.get(message.get("namespace"), ())):
+            try:
+                listener(message.get("key"))
+            except Exception as e:
+                print(f"Error handling shared cache invalidation: {e}")
+
+
+def shared_tier_from_env() -> Optional[SharedTier]:
+    """The shared tier configured by SHARED_CACHE_URL / REDIS_URL, or None for per-process caching only."""
+    if not SHARED_CACHE_URL:
+        return None
+    if redis is None:
+        print("SHARED_CACHE_URL is set but the redis package is not installed; caching per process only.")
+        return None
+    return SharedTier(SHARED_CACHE_URL)
@@ -0,0 +1,63 @@
+"""Source links for answers, aggregated from retrieved and referenced chunks."""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+SOURCE_URL = "https://hcux402.teagasc.net//document/{doc_id}?ext={ext}&prefix=document"
+
+
+def source_link(doc_id: str, doc_name: str = "") -> str:
+    ext = ""
+    if doc_name and "." in doc_name:
+        ext = doc_name.split(".")[-1]
+    return SOURCE_URL.format(doc_id=doc_id, ext=ext)
+
+
+def _field(chunk: Any, name: str) -> Any:
+    # Retrieval chunks are serialized dicts; stream references may be dicts or SDK objects.
+    if isinstance(chunk, dict):
+        return chunk.get(name)
+    return getattr(chunk, name, None)
+
+
+class SourceAggregator:
+    """
+    Collects the documents behind an answer's chunks.
+
+    Each chunk id is processed once, however often it is re-sent. Documents
+    are ranked by the best similarity of any of their chunks, ties broken by
+    first appearance.
+    """
+
+    def __init__(self):
+        self._seen: Set[str] = set()
+        self._documents: Dict[str, Tuple[float, int, str]] = {}  # doc id -> (best similarity, order, name)
+
+    def add(self, chunks: Iterable[Any]):
+        for chunk in chunks or ():
+            chunk_id = _field(chunk, "id")
+            if chunk_id is not None:
+                if chunk_id in self._seen:
+                    continue
+                self._seen.add(chunk_id)
+            doc_id = _field(chunk, "document_id")
+            if doc_id:
+                self.add_document(doc_id, _field(chunk, "document_name"), _field(chunk, "similarity") or 0.0)
+
+    def add_document(self, doc_id: str, name: Optional[str] = None, similarity: float = 0.0):
+        """Add a document directly, e.g. the one a ChunkTable holds, without visiting its chunks."""
+        best = self._documents.get(doc_id)
+        if best is None:
+            self._documents[doc_id] = (similarity, len(self._documents), name or "")
+        elif similarity > best[0]:
+            self._documents[doc_id] = (similarity, best[1], best[2])
+
+    def links(self) -> List[str]:
+        """De-duplicated source links, best-matching document first."""
+        ranked = sorted(self._documents.items(), key=lambda item: (-item[1][0], item[1][1]))
+        return [source_link(doc_id, name) for doc_id, (_, _, name) in ranked]
+
+
+def extract_source_links_from_chunks(chunks: List[Dict[str, Any]]) -> Set[str]:
+    aggregator = SourceAggregator()
+    aggregator.add(chunks)
+    return set(aggregator.links())
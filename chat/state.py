@@ -1,82 +1,157 @@
 import asyncio
-import os
-import re
-from typing import Any, Dict, List, Set
+import time
+from typing import Any, Dict, List, Optional
 
-from dotenv import load_dotenv
 import reflex as rx
-from ragflow_sdk import RAGFlow
-
-load_dotenv()
-
-# Retrieve configuration from environment variables for RAGFlow.
-RAGFLOW_API_KEY = os.getenv("RAGFLOW_API_KEY")
-RAGFLOW_BASE_URL = os.getenv("RAGFLOW_BASE_URL")
-AGENT_NAME = os.getenv("AGENT_NAME") or os.getenv("RAGFLOW_AGENT_NAME")
-ACRES_DATABASE = os.getenv("ACRES_DATABASE")  # New env var for the database name
-
-if not RAGFLOW_API_KEY:
-    raise Exception("Please set RAGFLOW_API_KEY environment variable.")
-if not ACRES_DATABASE:
-    raise Exception("Please set ACRES_DATABASE environment variable.")
-
-# Initialize the RAGFlow object.
-rag_object = RAGFlow(api_key=RAGFLOW_API_KEY, base_url=RAGFLOW_BASE_URL)
-assistant_list = rag_object.list_chats(name=AGENT_NAME)
-if not assistant_list:
-    raise Exception(f"No chat agent found with name '{AGENT_NAME}'")
-assistant = assistant_list[0]
-
-# Create (or get) the ACRES dataset.
-try:
-    acres_dataset = rag_object.create_dataset(name=ACRES_DATABASE)
-except Exception as e:
-    if "Duplicated dataset name" in str(e):
-        datasets = rag_object.list_datasets()  # Assumes a list_datasets method exists.
-        acres_dataset = next((ds for ds in datasets if ds.name == ACRES_DATABASE), None)
-        if acres_dataset is None:
-            raise Exception(f"Dataset '{ACRES_DATABASE}' exists but could not be retrieved.")
-    else:
-        raise e
-
-def remove_duplicate_trailing(text: str, min_length: int = 5) -> str:
-    n = len(text)
-    if n < 2 * min_length:
-        return text
-    for l in range(n // 2, min_length - 1, -1):
-        if text[-2 * l:-l] == text[-l:]:
-            return text[:-l]
-    return text
-
-def clean_response(text: str) -> str:
-    cleaned = re.sub(r"##\d+\$\$", "", text)
-    return remove_duplicate_trailing(cleaned, min_length=5)
-
-def serialize_chunk(chunk) -> dict:
-    return {
-        "id": chunk.id,
-        "content": chunk.content,
-        "document_id": getattr(chunk, "document_id", None),
-        "document_name": getattr(chunk, "document_name", None),
-        "position": getattr(chunk, "position", None),
-        "dataset_id": getattr(chunk, "dataset_id", None),
-        "similarity": getattr(chunk, "similarity", None),
-        "vector_similarity": getattr(chunk, "vector_similarity", None),
-        "term_similarity": getattr(chunk, "term_similarity", None),
-    }
-
-def extract_source_links_from_chunks(chunks: List[Dict[str, Any]]) -> Set[str]:
-    links = set()
-    for chunk in chunks:
-        doc_id = chunk.get("document_id")
-        if doc_id:
-            doc_name = chunk.get("document_name", "")
-            ext = ""
-            if doc_name and "." in doc_name:
-                ext = doc_name.split(".")[-1]
-            link = f"https://hcux402.teagasc.net//document/{doc_id}?ext={ext}&prefix=document"
-            links.add(link)
-    return links
+from ragflow_sdk.modules.document import Document
+
+from chat.answers import AnswerHub, SharedGeneration, answer_key
+from chat.catalog import DocumentCatalog
+from chat.chunks import ChunkCache, ChunkTable, document_version, serialize_retrieved
+from chat.client import get_assistant, get_dataset, get_rag, get_retrieval_datasets, warm_up
+from chat.context import context_fields, pack_context
+from chat.document_search import DOCUMENT_PAGE_SIZE
+from chat.generations import GenerationRegistry
+from chat.history import HISTORY_PAGE_SIZE, HISTORY_WINDOW, ChatHistory
+from chat.lexical import select_passages
+from chat.local_index import LOCAL_MIN_RESULTS, RETRIEVAL_MODE, LocalIndex
+from chat.metrics import metrics, register_cache
+from chat.multi_dataset import retrieve_datasets
+from chat.prefetch import Prefetcher
+from chat.postprocess import StreamingCleaner, remove_duplicate_trailing
+from chat.retrieval import RetrievalCache
+from chat.scheduler import QUEUE_POLL_INTERVAL, QueueFull, generation_limiter, retrieval_limiter
+from chat.sessions import AskLocks, SessionManager
+from chat.shared_cache import shared_tier_from_env
+from chat.sources import SourceAggregator
+from chat.streaming import StreamBuffer, aiter_in_thread
+
+# RAGFlow is contacted lazily; start resolving the assistant and dataset without blocking startup.
+warm_up()
+
+# Redis tier behind the caches below, shared by all backend replicas (None without REDIS_URL).
+shared_tier = shared_tier_from_env()
+
+# Shared document list; warmed in the background so the first page load finds it populated.
+document_catalog = DocumentCatalog(get_dataset, shared=shared_tier)
+document_catalog.start()
+
+# Shared chunk cache; documents are opened by id without a list_documents round trip.
+chunk_cache = ChunkCache(
+    lambda doc_id: Document(get_rag(), {"id": doc_id, "dataset_id": get_dataset().id}),
+    shared=shared_tier,
+)
+
+# Parameters for the knowledge1 similarity search; part of the retrieval cache key.
+RETRIEVAL_PARAMS = dict(
+    page=1,
+    page_size=30,
+    similarity_threshold=0.3,
+    vector_similarity_weight=0.3,
+    top_k=1024,
+    rerank_id=None,
+    keyword=False,
+)
+retrieval_cache = RetrievalCache(shared=shared_tier)
+
+# Optional local first-stage index (RETRIEVAL_MODE=local or hybrid), synced from the catalog.
+local_index = None
+if RETRIEVAL_MODE in ("local", "hybrid"):
+    local_index = LocalIndex()
+    # Fetched outside chunk_cache so a sync does not evict the papers users select.
+    local_index.start_sync(document_catalog.records, chunk_cache.fetch)
+
+# Chat sessions are leased per client on the first question, from a pre-warmed pool.
+session_manager = SessionManager(get_assistant)
+session_manager.start()
+ask_locks = AskLocks()
+
+# Answers shared between clients asking the same question on the same context.
+answer_hub = AnswerHub()
+
+register_cache("retrieval", retrieval_cache.stats)
+register_cache("chunks", chunk_cache.stats)
+register_cache("answers", answer_hub.stats)
+if shared_tier is not None:
+    register_cache("shared", shared_tier.stats)
+metrics.add_collector(
+    "rag_chat_sessions", "gauge", "RAGFlow chat sessions leased to clients or kept spare.",
+    lambda: [("rag_chat_sessions", {"state": key}, value) for key, value in session_manager.stats().items()],
+)
+
+# The answer being streamed to each client, so it can be stopped or superseded.
+generations = GenerationRegistry()
+metrics.add_collector(
+    "rag_generations_active", "gauge", "Answers currently being generated.",
+    lambda: [("rag_generations_active", {}, len(generations))],
+)
+
+# Full conversations live here; State.chats only holds the most recent window of each.
+chat_history = ChatHistory()
+
+async def retrieve_knowledge1(question: str, client: str) -> List[Dict[str, Any]]:
+    """
+    Performs a similarity search using the RAGFlow.retrieve API and returns the serialized chunks.
+    ACRES_DATABASE and any EXTRA_DATASETS are searched concurrently and merged (see chat.multi_dataset).
+    Results from ACRES_DATABASE alone are cached per normalized question until the dataset changes.
+    In local mode the local index answers unless it has no hits; in hybrid
+    mode RAGFlow is also used when it has fewer than LOCAL_MIN_RESULTS.
+    """
+    try:
+        dataset_ids = [dataset.id for dataset in await asyncio.to_thread(get_retrieval_datasets)]
+        key = retrieval_cache.key(question, dataset_ids, dict(RETRIEVAL_PARAMS, mode=RETRIEVAL_MODE))
+        dataset_version = document_catalog.version
+        cached = retrieval_cache.get(key, dataset_version)
+        if cached is None and retrieval_cache.shared is not None:
+            cached = await asyncio.to_thread(retrieval_cache.get_shared, key, dataset_version)
+        if cached is not None:
+            return cached
+        if local_index is not None:
+            try:
+                local_chunks = None
+                if local_index.ready():
+                    with metrics.span("retrieval", source="local"):
+                        local_chunks = await asyncio.to_thread(
+                            local_index.search, question, RETRIEVAL_PARAMS["page_size"])
+            except Exception as e:
+                # E.g. a segment replaced by another process mid-read; RAGFlow still answers.
+                print(f"Error searching the local index: {e}")
+                metrics.inc("rag_errors_total", stage="local_index")
+                local_chunks = None
+            enough = 1 if RETRIEVAL_MODE == "local" else LOCAL_MIN_RESULTS
+            if local_chunks is not None and len(local_chunks) >= enough:
+                retrieval_cache.set(key, dataset_version, local_chunks)
+                return local_chunks
+        async with retrieval_limiter.slot(client):
+            with metrics.span("retrieval", source="ragflow"):
+                serialized_chunks, complete = await retrieve_datasets(
+                    dataset_ids,
+                    lambda dataset_id: [
+                        serialize_retrieved(chunk)
+                        for chunk in get_rag().retrieve_scored(
+                            question=question,
+                            dataset_ids=[dataset_id],
+                            **RETRIEVAL_PARAMS
+                        )
+                        if chunk.get("content") is not None
+                    ],
+                    limit=RETRIEVAL_PARAMS["page_size"],
+                )
+        # Entries are versioned by ACRES_DATABASE's catalog only, so results merged with
+        # EXTRA_DATASETS would outlive changes to those; partial results are not cached either.
+        if complete and len(dataset_ids) == 1:
+            retrieval_cache.set(key, dataset_version, serialized_chunks)
+        return serialized_chunks
+    except QueueFull:
+        raise
+    except Exception as e:
+        print(f"Error in retrieve_knowledge1: {e}")
+        metrics.inc("rag_errors_total", stage="retrieval")
+        return []
+
+
+# Retrieval started while a question is still being typed, claimed on submit.
+prefetcher = Prefetcher(retrieve_knowledge1)
 
 class QA(rx.Base):
     question: str
@@ -84,40 +159,122 @@ class QA(rx.Base):
     sources: List[str] = []       # Field for storing source links.
     show_sources: bool = False    # Controls the dropdown visibility.
     hide_answer: bool = False     # Temporary flag to hide the answer while cleaning.
+    seq: int = -1                 # Position in the chat history store; -1 if not stored.
+    error: str = ""               # Why the answer failed, if it did (e.g. for chat.batch); not stored.
+
+def opener_message() -> QA:
+    return QA(
+        question="",
+        answer="Hi, I'm your Research Paper Assistant. Ask me any question about published Teagasc Research Papers.",
+        sources=[],
+        show_sources=False,
+        hide_answer=False,
+    )
 
 class State(rx.State):
+    # Only the most recent HISTORY_WINDOW messages of each chat; older ones stay in chat_history.
     chats: Dict[str, List[QA]] = {}
+    older_available: Dict[str, bool] = {}
     current_chat: str = ""
     question: str = ""
     processing: bool = False
+    # The question being answered, the chat it was asked in, and its answer so far, shown while streaming.
+    pending_question: str = ""
+    pending_chat: str = ""
+    streaming_answer: str = ""
+    # Position in the generation queue while waiting for a free slot; 0 otherwise.
+    queue_position: int = 0
     new_chat_name: str = ""
     show_sources: bool = False
-    _rag_session: Any = None
 
-    # Variables for document selection.
+    # The selected document's id and name; its chunks stay server-side in chunk_cache.
     selected_document: Dict[str, Any] = None
-    document_chunks: List[Dict[str, Any]] = []
+    # One page of the Documents picker; the full catalog stays on the server.
+    document_query: str = ""
+    document_page: int = 0
+    document_results: List[Dict[str, Any]] = []
+    document_total: int = 0
+
+    _history_loaded: bool = False
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.chats = {"Default": []}
         self.current_chat = "Default"
-        opener = QA(
-            question="",
-            answer="Hi, I'm your Research Paper Assistant. Ask me any question about published Teagasc Research Papers.",
-            sources=[],
-            show_sources=False,
-            hide_answer=False,
-        )
-        self.chats["Default"].append(opener)
-        self._rag_session = assistant.create_session()
-
-    def create_chat(self):
-        self.current_chat = self.new_chat_name
-        self.chats[self.new_chat_name] = []
-
-    def delete_chat(self):
+        self.chats["Default"].append(opener_message())
+
+    def _client_token(self) -> str:
+        return self.router.session.client_token
+
+    async def load_history(self):
+        """
+        Restore this client's chats from the history store on page load,
+        keeping only the most recent window of each.
+        """
+        if self._history_loaded:
+            return
+        self._history_loaded = True
+        token = self._client_token()
+        try:
+            names = await asyncio.to_thread(chat_history.chat_names, token)
+            windows = {
+                name: await asyncio.to_thread(chat_history.page, token, name, None, HISTORY_WINDOW)
+                for name in names
+            }
+        except Exception as e:
+            print(f"Error loading chat history: {e}")
+            return
+        for name, rows in windows.items():
+            messages = [QA(**row, show_sources=bool(row["sources"])) for row in rows]
+            older = bool(rows) and rows[0]["seq"] > 0
+            if name == "Default" and not older:
+                messages.insert(0, opener_message())
+            self.chats[name] = messages
+            self.older_available[name] = older
+
+    async def load_older_messages(self):
+        """Prepend the previous page of the current chat from the history store."""
+        chat_name = self.current_chat
+        messages = self.chats[chat_name]
+        before = next((qa.seq for qa in messages if qa.seq >= 0), None)
+        if before is None:
+            # Nothing loaded is stored (the opener and unsaved turns); a page from None would repeat the newest.
+            return
+        try:
+            rows = await asyncio.to_thread(chat_history.page, self._client_token(), chat_name, before)
+        except Exception as e:
+            print(f"Error loading older messages: {e}")
+            return
+        older = [QA(**row, show_sources=bool(row["sources"])) for row in rows]
+        self.chats[chat_name] = older + list(messages)
+        self.older_available[chat_name] = len(rows) == HISTORY_PAGE_SIZE and rows[0]["seq"] > 0
+
+    def _trim_window(self, chat_name: str):
+        messages = self.chats[chat_name]
+        excess = len(messages) - HISTORY_WINDOW
+        if excess > 0:
+            del messages[:excess]
+            self.older_available[chat_name] = True
+
+    async def create_chat(self):
+        """Create and switch to a chat; an existing name just switches to it, keeping its messages."""
+        name = self.new_chat_name
+        if name not in self.chats:
+            self.chats[name] = []
+            try:
+                await asyncio.to_thread(chat_history.create_chat, self._client_token(), name)
+            except Exception as e:
+                print(f"Error saving chat {name}: {e}")
+        self.current_chat = name
+
+    async def delete_chat(self):
+        try:
+            await asyncio.to_thread(chat_history.delete_chat, self._client_token(), self.current_chat)
+        except Exception as e:
+            print(f"Error deleting chat {self.current_chat}: {e}")
+            return
         del self.chats[self.current_chat]
+        self.older_available.pop(self.current_chat, None)
         if not self.chats:
             self.chats = {"Default": []}
         self.current_chat = list(self.chats.keys())[0]
@@ -129,152 +286,329 @@ class State(rx.State):
     def chat_titles(self) -> List[str]:
         return list(self.chats.keys())
 
-    @rx.var(cache=False)
-    def document_names(self) -> List[str]:
-        docs = acres_dataset.list_documents(page=1, page_size=1000)
-        return [doc.name for doc in docs]
+    def _load_document_page(self):
+        self.document_results, self.document_total = document_catalog.search(self.document_query, self.document_page)
 
-    @rx.var(cache=False)
-    def documents(self) -> List[Dict[str, Any]]:
-        docs = acres_dataset.list_documents(page=1, page_size=1000)
-        return [{"id": doc.id, "name": doc.name} for doc in docs]
+    def open_documents(self, is_open: bool):
+        """Start the Documents picker from the first page of the full list."""
+        if is_open:
+            self.document_query = ""
+            self.document_page = 0
+            self._load_document_page()
+
+    def search_documents(self, query: str):
+        self.document_query = query
+        self.document_page = 0
+        self._load_document_page()
 
+    def next_document_page(self):
+        if self.document_has_next:
+            self.document_page += 1
+            self._load_document_page()
+
+    def previous_document_page(self):
+        if self.document_page > 0:
+            self.document_page -= 1
+            self._load_document_page()
+
+    @rx.var(cache=True)
+    def document_has_next(self) -> bool:
+        return (self.document_page + 1) * DOCUMENT_PAGE_SIZE < self.document_total
+
+    @rx.var(cache=True)
+    def document_page_label(self) -> str:
+        if not self.document_total:
+            return "No documents found."
+        first = self.document_page * DOCUMENT_PAGE_SIZE + 1
+        last = min(self.document_total, first + DOCUMENT_PAGE_SIZE - 1)
+        return f"{first}-{last} of {self.document_total}"
+
+    @rx.event(background=True)
     async def process_question(self, form_data: Dict[str, Any]):
-        self.show_sources = False
+        # A background event, so stop_generation and the next question are not
+        # queued behind the answer being streamed.
         question = form_data["question"]
         if question == "":
             return
-        async for _ in self.ragflow_process_question(question):
-            yield
+        await self.ragflow_process_question(question)
+
+    def prefetch_question(self, text: str):
+        """Start retrieving for the question being typed, so the answer can start sooner."""
+        if self.selected_document is None:
+            prefetcher.start(self._client_token(), text)
+
+    def stop_generation(self):
+        """Stop the answer being streamed; the partial answer is kept."""
+        generations.cancel(self._client_token(), "stopped")
 
     async def similarity_search_knowledge1(self, question: str) -> List[Dict[str, Any]]:
-        """
-        Performs a similarity search using the RAGFlow.retrieve API and returns the serialized chunks.
-        """
-        try:
-            chunks = await asyncio.to_thread(lambda: rag_object.retrieve(
-                question=question,
-                dataset_ids=[acres_dataset.id],
-                page=1,
-                page_size=30,
-                similarity_threshold=0.3,
-                vector_similarity_weight=0.3,
-                top_k=1024,
-                rerank_id=None,
-                keyword=False
-            ))
-            serialized_chunks = [
-                serialize_chunk(chunk)
-                for chunk in chunks
-                if chunk is not None and getattr(chunk, "content", None) is not None
-            ]
-            return serialized_chunks
-        except Exception as e:
-            print(f"Error in similarity_search_knowledge1: {e}")
-            return []
+        return await retrieve_knowledge1(question, self._client_token())
 
     async def ragflow_process_question(self, question: str):
-        qa = QA(question=question, answer="", sources=[], show_sources=False, hide_answer=False)
-        self.chats[self.current_chat].append(qa)
-        self.processing = True
-        yield
-        accumulated_answer = ""
-        source_links = set()
+        # A new question from the same client cancels the one still streaming,
+        # which publishes its partial answer before this one starts.
+        generation = await generations.begin(self._client_token())
         try:
-            kwargs = {}
-            if self.selected_document and self.document_chunks:
-                print("Passing selected_doc context only.")
-                kwargs["selected_doc"] = self.document_chunks
+            await self._answer(question, generation)
+        finally:
+            generations.finish(generation)
+
+    async def _selected_chunks(self, selected_document: Dict[str, Any]) -> Optional[ChunkTable]:
+        """The selected document's chunks from chunk_cache; None if it has none or they can't be loaded."""
+        record = document_catalog.get(selected_document["id"]) or selected_document
+        try:
+            chunks = await asyncio.to_thread(chunk_cache.get, record)
+        except Exception as e:
+            print(f"Error loading chunks for document {record['id']}: {e}")
+            metrics.inc("rag_errors_total", stage="select_document")
+            return None
+        return chunks if len(chunks) else None
+
+    def _answer_context(self, selected_document: Optional[Dict[str, Any]]):
+        """What an answer depends on besides the question; None until the catalog has loaded."""
+        if selected_document:
+            record = document_catalog.get(selected_document["id"]) or selected_document
+            return "selected_doc", record["id"], document_version(record)
+        if document_catalog.version is None:
+            return None
+        return "knowledge1", document_catalog.version, RETRIEVAL_MODE
+
+    async def _generate(self, shared: SharedGeneration, question: str, selected_document, document_chunks,
+                        prefetched=None):
+        """
+        Build the context and stream the assistant's answer into `shared`.
+        Runs as its own task so that subscribers can come and go. `prefetched`
+        is a retrieval started while the question was typed (see chat.prefetch).
+        """
+        token = self._client_token()
+        kwargs = {}
+        if selected_document:
+            # Forward only the passages of the paper that match this question.
+            with metrics.span("context_build", context="selected_doc"):
+                doc_id = selected_document["id"]
+                record = document_catalog.get(doc_id) or selected_document
+                index_key = (doc_id, document_version(record), len(document_chunks))
+                # Building the BM25 index of a large paper would stall every client's events; keep it off the loop.
+                passages = await asyncio.to_thread(select_passages, index_key, document_chunks, question)
+                kwargs["selected_doc"] = context_fields(passages)
                 kwargs["knowledge1"] = ""  # disable full knowledge search when a specific document is selected
-                # Use sources from the selected document
-                source_links = extract_source_links_from_chunks(self.document_chunks)
-            else:
-                print("No specific document selected; performing similarity search for knowledge1.")
+                shared.context_chunks = document_chunks
+        else:
+            all_chunks = None
+            if prefetched is not None:
+                with metrics.span("prefetch_wait"):
+                    all_chunks = await prefetched
+            if not all_chunks:
                 all_chunks = await self.similarity_search_knowledge1(question)
-                kwargs["knowledge1"] = all_chunks
+            # Keep the prompt small: de-duplicated chunks under a token budget, prompt fields only.
+            # The shingle/MMR packing is CPU-bound, so it runs on a worker thread.
+            with metrics.span("context_build", context="knowledge1"):
+                packed_chunks, stats = await asyncio.to_thread(pack_context, all_chunks)
+                kwargs["knowledge1"] = context_fields(packed_chunks)
                 kwargs["selected_doc"] = ""
-                source_links = extract_source_links_from_chunks(all_chunks)
-
-            # Ask the assistant with the additional context in kwargs.
-            for message in self._rag_session.ask(question, stream=True, **kwargs):
-                if hasattr(message, "content") and message.content:
-                    new_part = message.content[len(accumulated_answer):]
-                    accumulated_answer = message.content
-                    filtered_part = re.sub(r"##\d+\$\$", "", new_part)
-                    self.chats[self.current_chat][-1].answer += filtered_part
-                    if hasattr(message, "reference") and message.reference:
-                        for chunk in message.reference:
-                            document_id = None
-                            document_name = None
-                            if isinstance(chunk, dict):
-                                document_id = chunk.get("document_id")
-                                document_name = chunk.get("document_name")
-                            else:
-                                document_id = getattr(chunk, "document_id", None)
-                                document_name = getattr(chunk, "document_name", None)
-                            if document_id:
-                                ext = ""
-                                if document_name and "." in document_name:
-                                    ext = document_name.split(".")[-1]
-                                link = f"https://hcux402.teagasc.net//document/{document_id}?ext={ext}&prefix=document"
-                                source_links.add(link)
-                    self.chats = self.chats
-                    yield
-        except Exception as e:
-            self.chats[self.current_chat][-1].answer += f"\nError: {e}"
-            self.chats = self.chats
-
-        self.chats[self.current_chat][-1].hide_answer = True
-        self.chats = self.chats
-        final_answer = clean_response(self.chats[self.current_chat][-1].answer)
-        await asyncio.sleep(0.1)
-        self.chats[self.current_chat][-1].answer = final_answer
-        self.chats[self.current_chat][-1].hide_answer = False
-        self.chats = self.chats
-
-        # Set sources based on which branch was used.
-        # If using similarity search (knowledge1), show those sources.
-        # If a document is selected, show the selected document's sources.
-        if self.selected_document and self.document_chunks:
-            self.chats[self.current_chat][-1].sources = list(extract_source_links_from_chunks(self.document_chunks))
+                shared.context_chunks = packed_chunks
+            metrics.inc("rag_context_tokens_total", stats["tokens_in"], kind="retrieved")
+            metrics.inc("rag_context_tokens_total", stats["tokens_out"], kind="sent")
+
+        if shared.cancel.is_set():
+            return
+        # Held until the stream ends: the session's previous answer may still be streaming for others.
+        ask_lock = await ask_locks.acquire(token, shared.cancel)
+        if ask_lock is None:
+            return
+        try:
+            # Queue for a generation slot only once the context is ready, so retrieval never holds one.
+            ticket = shared.ticket = generation_limiter.enter(token)
+            try:
+                while not ticket.granted and not shared.cancel.is_set():
+                    await ticket.wait(QUEUE_POLL_INTERVAL)
+                if shared.cancel.is_set():
+                    return
+
+                # Ask the assistant with the additional context in kwargs.
+                # The SDK generator blocks on HTTP reads, so pump it on a worker thread;
+                # cancelling closes its response so RAGFlow stops generating.
+                session = await asyncio.to_thread(session_manager.acquire, token)
+                if not session_manager.is_fresh(token):
+                    # Answered since the question was keyed; the answer now depends on that turn.
+                    shared.shareable = False
+                session_manager.answered(token)
+                ask_started = time.perf_counter()
+                first_token = True
+                messages = aiter_in_thread(
+                    session.ask(question, stream=True, **kwargs),
+                    cancel=shared.cancel,
+                    abort=get_rag().close_stream,
+                )
+                async for message in messages:
+                    if hasattr(message, "content") and message.content:
+                        if first_token:
+                            first_token = False
+                            metrics.observe("rag_stage_duration_seconds", time.perf_counter() - ask_started,
+                                            stage="first_token")
+                        shared.publish(message)
+                if not shared.cancel.is_set():
+                    metrics.observe("rag_stage_duration_seconds", time.perf_counter() - ask_started, stage="stream")
+            finally:
+                ticket.release()
+        finally:
+            ask_lock.release()
+
+    async def _answer(self, question: str, generation):
+        # The in-progress answer is kept out of `chats` so each streamed update
+        # only ships `streaming_answer` rather than re-serializing every chat.
+        async with self:
+            self.show_sources = False
+            chat_name = self.current_chat
+            self.pending_question = question
+            self.pending_chat = chat_name
+            self.streaming_answer = ""
+            self.processing = True
+        started = time.perf_counter()
+        accumulated_answer = ""
+        buffer = StreamBuffer()
+        cleaner = StreamingCleaner()
+        # Sources: the selected document's chunks, or the knowledge1 chunks plus
+        # whatever the assistant references (folded in once, after streaming).
+        sources = SourceAggregator()
+        latest_reference = None
+        error = ""
+        selected_document = self.selected_document
+        document_chunks = await self._selected_chunks(selected_document) if selected_document else None
+        use_selected_document = document_chunks is not None
+        metrics.inc("rag_questions_total", context="selected_doc" if use_selected_document else "knowledge1")
+
+        # Identical questions on the same context share one generation and its cached result,
+        # but only on a fresh session: a follow-up's answer depends on the turns before it.
+        token = self._client_token()
+        context = self._answer_context(selected_document if use_selected_document else None)
+        key = answer_key(question, context if session_manager.is_fresh(token) else None)
+        prefetched = None if use_selected_document else prefetcher.take(token, question)
+        cached = answer_hub.cached(key)
+        shared = None
+        if cached is not None:
+            metrics.inc("rag_answers_shared_total", how="cached")
+            buffer.add(cached[0])
         else:
-            self.chats[self.current_chat][-1].sources = list(source_links)
-        self.chats = self.chats
+            try:
+                shared = answer_hub.join(
+                    key,
+                    lambda shared: self._generate(
+                        shared, question, selected_document if use_selected_document else None, document_chunks,
+                        prefetched,
+                    ),
+                )
+                position = 0
+                try:
+                    async for message in shared.updates(generation.cancelled, QUEUE_POLL_INTERVAL):
+                        if message is None:
+                            # Still waiting: keep the queue position shown to the user current.
+                            ticket = shared.ticket
+                            new_position = ticket.position() if ticket is not None else 0
+                            if new_position != position:
+                                position = new_position
+                                async with self:
+                                    self.queue_position = position
+                            continue
+                        if position:
+                            position = 0
+                            async with self:
+                                self.queue_position = 0
+                        new_part = message.content[len(accumulated_answer):]
+                        accumulated_answer = message.content
+                        filtered_part = cleaner.feed(new_part)
+                        # Each message repeats the full reference list; keep only the latest.
+                        if getattr(message, "reference", None):
+                            latest_reference = message.reference
+                        if buffer.add(filtered_part):
+                            async with self:
+                                self.streaming_answer = buffer.flush()
+                finally:
+                    answer_hub.leave(shared)
+                if isinstance(shared.context_chunks, ChunkTable):
+                    # One document; its link needs no row of the table.
+                    table = shared.context_chunks
+                    sources.add_document(table.document_id, table.document_name)
+                else:
+                    sources.add(shared.context_chunks)
+            except QueueFull as e:
+                error = "busy"
+                buffer.add(str(e))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                metrics.inc("rag_errors_total", stage="answer")
+                buffer.add(cleaner.finish())
+                buffer.add(f"\nError: {e}")
 
-        self.processing = False
-        await asyncio.sleep(1)
-        self.chats[self.current_chat][-1].show_sources = True
-        self.chats = self.chats
+        # Markers were stripped while streaming; only the repeated tail is left to trim.
+        with metrics.span("cleanup"):
+            buffer.add(cleaner.finish())
+            answer = remove_duplicate_trailing(buffer.text, min_length=5)
+            if generation.cancelled.is_set():
+                answer += "\n\n*Stopped.*"
+
+        # The finished answer and its sources are published in a single update.
+        with metrics.span("publish"):
+            if cached is not None:
+                links = cached[1]
+            else:
+                if not use_selected_document and latest_reference:
+                    sources.add(latest_reference)
+                links = sources.links()
+                if (shared is not None and shared.completed and shared.shareable
+                        and not generation.cancelled.is_set()):
+                    answer_hub.store(key, answer, links)
+            if not error:
+                # Whether asked here or shared, later questions are follow-ups and are not shared.
+                session_manager.answered(token)
+            qa = QA(
+                question=question,
+                answer=answer,
+                sources=links,
+                show_sources=True,
+                hide_answer=False,
+                error=error,
+            )
+            try:
+                qa.seq = await asyncio.to_thread(
+                    chat_history.append, self._client_token(), chat_name, qa.question, qa.answer, qa.sources
+                )
+            except Exception as e:
+                print(f"Error saving chat history: {e}")
+            async with self:
+                if chat_name not in self.chats:
+                    self.chats[chat_name] = []  # Deleted while the answer was streaming.
+                self.chats[chat_name].append(qa)
+                self._trim_window(chat_name)
+                self.chats = self.chats
+                self.pending_question = ""
+                self.pending_chat = ""
+                self.streaming_answer = ""
+                self.queue_position = 0
+                self.processing = False
+        metrics.observe("rag_stage_duration_seconds", time.perf_counter() - started, stage="question")
 
     async def select_document(self, doc: Dict[str, Any]):
         """
-        Select a document and retrieve its chunks.
+        Select a document and make sure its chunks are cached, so the first
+        question about it does not wait for them. Only the id and name are
+        kept in state.
         """
-        self.selected_document = doc
-        documents = await asyncio.to_thread(lambda: acres_dataset.list_documents(id=doc["id"]))
-        if not documents:
-            self.document_chunks = []
-        else:
-            document_obj = documents[0]
-            chunks = await asyncio.to_thread(lambda: document_obj.list_chunks(page=1, page_size=200))
-            self.document_chunks = [
-                serialize_chunk(chunk)
-                for chunk in chunks
-                if chunk is not None and getattr(chunk, "content", None) is not None
-            ]
-            for chunk in self.document_chunks:
-                print("Chunk content:", chunk["content"])
+        self.selected_document = {"id": doc["id"], "name": doc.get("name", "")}
+        prefetcher.discard(self._client_token())
+        # Prefer the catalog record: it carries the version used to validate the cache.
+        record = document_catalog.get(doc["id"]) or doc
+        try:
+            with metrics.span("select_document"):
+                await asyncio.to_thread(chunk_cache.get, record)
+        except Exception as e:
+            print(f"Error loading chunks for document {doc['id']}: {e}")
+            metrics.inc("rag_errors_total", stage="select_document")
 
     def clear_selected_document(self):
         self.selected_document = None
-        self.document_chunks = []
-
-    @rx.var(cache=False)
-    def valid_document_chunks(self) -> List[Dict[str, Any]]:
-        """Return only chunks that have a non-null 'content' property."""
-        return [chunk for chunk in self.document_chunks if chunk.get("content") is not None]
 
-    @rx.var(cache=False)
+    @rx.var(cache=True)
     def selected_document_text(self) -> str:
         if self.selected_document:
             return f"Using document: {self.selected_document.get('name', '')}"
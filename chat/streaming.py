@@ -0,0 +1,147 @@
+"""Helpers for streaming RAGFlow answers without blocking the event loop."""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from typing import AsyncIterator, Callable, Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "32"))         # Max answers pumped at once.
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "64"))   # Buffered messages per answer.
+# Answers stream from a background event, where every push takes the state lock and,
+# with Redis, a full state get and set; a few pushes a second read as smooth.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.25"))  # Seconds between UI pushes.
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "1000"))          # Or after this many new chars.
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="stream")
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def aiter_in_thread(iterable: Iterable[T], queue_size: int = STREAM_QUEUE_SIZE,
+                          executor: Optional[concurrent.futures.Executor] = None,
+                          cancel: Optional[asyncio.Event] = None,
+                          abort: Optional[Callable[[int], None]] = None) -> AsyncIterator[T]:
+    """
+    Iterate a blocking iterable on a worker thread and yield its items asynchronously.
+
+    The worker blocks while the queue is full, so a slow consumer throttles the
+    producer. Errors raised by the iterable are re-raised in the consumer. If the
+    consumer stops early the worker stops at its next item and closes the iterable.
+
+    Args:
+        iterable: A synchronous iterable, e.g. the generator returned by Session.ask.
+        queue_size: How many items may be buffered ahead of the consumer.
+        executor: The pool to run on; defaults to the shared STREAM_WORKERS pool.
+        cancel: Ends the iteration as soon as it is set, without waiting for the next item.
+        abort: Called with the worker's thread id if the consumer stops while the
+            worker is still running, to unblock it (e.g. close its HTTP response).
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    worker_lock = threading.Lock()
+    worker = {"thread": None, "finished": False}
+
+    def put(item) -> bool:
+        if stop.is_set():
+            return False
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
+
+    def pump():
+        with worker_lock:
+            worker["thread"] = threading.get_ident()
+        iterator = None
+        try:
+            iterator = iter(iterable)
+            for item in iterator:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            with worker_lock:
+                worker["finished"] = True
+        put(_DONE)
+
+    loop.run_in_executor(executor or _executor, pump)
+    cancelled = asyncio.ensure_future(cancel.wait()) if cancel is not None else None
+    try:
+        while True:
+            if cancelled is None:
+                item = await queue.get()
+            else:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait((getter, cancelled), return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    return
+                item = getter.result()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        if cancelled is not None:
+            cancelled.cancel()
+        if abort is not None:
+            with worker_lock:
+                if worker["thread"] is not None and not worker["finished"]:
+                    abort(worker["thread"])
+
+
+class StreamBuffer:
+    """
+    Accumulates streamed answer fragments and decides when the UI should be
+    updated: after STREAM_FLUSH_INTERVAL seconds or STREAM_FLUSH_CHARS new
+    characters, whichever comes first.
+    """
+
+    def __init__(self, interval: float = STREAM_FLUSH_INTERVAL, max_chars: int = STREAM_FLUSH_CHARS):
+        self.interval = interval
+        self.max_chars = max_chars
+        self._parts: List[str] = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def add(self, fragment: str) -> bool:
+        """Append a fragment; returns True when a flush is due."""
+        if fragment:
+            self._parts.append(fragment)
+            self._pending += len(fragment)
+        if not self._pending:
+            return False
+        return self._pending >= self.max_chars or time.monotonic() - self._last_flush >= self.interval
+
+    def flush(self) -> str:
+        """Mark pending fragments as pushed and return the full text so far."""
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        return self.text
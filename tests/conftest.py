@@ -0,0 +1,26 @@
+"""A fake RAGFlow server (benchmarks.fake_ragflow) the app under test is pointed at."""
+
+import os
+
+import pytest
+
+from benchmarks.fake_ragflow import FakeConfig, start_server
+
+
+@pytest.fixture(scope="session")
+def fake(tmp_path_factory):
+    server, fake = start_server(FakeConfig(documents=20, chunks_per_document=5, latency=0.0, ttft=0.01,
+                                           token_rate=2000.0, answer_tokens=40))
+    workdir = tmp_path_factory.mktemp("rag")
+    # Configuration is read at import time, so point the app at the fake server before chat.state is imported.
+    os.environ.update(
+        RAGFLOW_API_KEY="test",
+        RAGFLOW_BASE_URL=f"http://127.0.0.1:{server.server_port}",
+        AGENT_NAME=fake.config.agent_name,
+        ACRES_DATABASE=fake.config.dataset_name,
+        CHAT_HISTORY_DB=str(workdir / "chat_history.db"),
+        LOCAL_INDEX_DIR=str(workdir / "local_index"),
+        ANSWER_CACHE_TTL="600",
+    )
+    yield fake
+    server.shutdown()
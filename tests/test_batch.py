@@ -0,0 +1,63 @@
+"""The batch runner and headless states, end to end against benchmarks.fake_ragflow."""
+
+import asyncio
+import json
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_new_state_answers_with_its_own_client_token(fake):
+    from chat import state as state_module
+    from chat.headless import new_state, run_background
+
+    first = new_state(state_module.State, "client-a")
+    second = new_state(state_module.State, "client-b")
+    assert first._client_token() == "client-a"
+    assert second._client_token() == "client-b"
+
+    async def ask():
+        while state_module.document_catalog.records() is None:
+            await asyncio.sleep(0.05)
+        await run_background(first, state_module.State.process_question, {"question": "Nitrogen in grassland?"},
+                             on_update=lambda: None)
+
+    asyncio.run(ask())
+    qa = first.chats[first.current_chat][-1]
+    assert qa.question == "Nitrogen in grassland?"
+    assert qa.answer and "Error" not in qa.answer
+    assert qa.sources
+
+
+def test_batch_answers_and_resumes(fake, tmp_path):
+    from chat import batch
+
+    questions = tmp_path / "questions.jsonl"
+    output = tmp_path / "results.jsonl"
+    questions.write_text(
+        json.dumps({"id": "q1", "question": "What affects barley yield?"}) + "\n"
+        + json.dumps({"id": "q2", "question": "Summarise this paper.", "document_id": "doc-000003"}) + "\n"
+        + json.dumps({"id": "q3", "question": "Anything?", "document_id": "no-such-document"}) + "\n",
+        encoding="utf-8",
+    )
+
+    first_ask = len(fake.asks)
+    assert batch.main([str(questions), str(output), "--workers", "1"]) == 1
+    results = {record["id"]: record for record in read_results(output)}
+    assert set(results) == {"q1", "q2", "q3"}
+    assert results["q1"]["error"] is None and results["q1"]["answer"] and results["q1"]["sources"]
+    assert results["q2"]["error"] is None and results["q2"]["answer"]
+    assert len(results["q2"]["sources"]) == 1 and "doc-000003" in results["q2"]["sources"][0]
+    assert results["q3"]["error"].startswith("LookupError")
+    # One worker, yet each question was asked on a session of its own.
+    sessions = [session_id for session_id, _ in fake.asks[first_ask:]]
+    assert len(sessions) == 2 and len(set(sessions)) == 2
+    asks = fake.requests.get("ask", 0)
+
+    # A rerun only retries the failed item.
+    assert batch.main([str(questions), str(output)]) == 1
+    records = read_results(output)
+    assert len(records) == 4 and records[-1]["id"] == "q3"
+    assert fake.requests.get("ask", 0) == asks
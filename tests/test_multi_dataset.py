@@ -0,0 +1,34 @@
+"""Merging retrieval results from several datasets (chat.multi_dataset)."""
+
+import asyncio
+
+from chat.multi_dataset import merge_ranked, retrieve_datasets
+
+
+def chunk(chunk_id, similarity=None):
+    return {"id": chunk_id, "content": chunk_id, "similarity": similarity}
+
+
+def test_merge_ranks_by_similarity_so_a_lone_weak_hit_stays_low():
+    primary = [chunk("a1", 0.9), chunk("a2", 0.8), chunk("a3", 0.7)]
+    extra = [chunk("b1", 0.35)]
+    assert [c["id"] for c in merge_ranked([primary, extra], limit=4)] == ["a1", "a2", "a3", "b1"]
+    assert [c["id"] for c in merge_ranked([primary, extra], limit=2)] == ["a1", "a2"]
+
+
+def test_merge_interleaves_by_rank_without_similarities():
+    primary = [chunk("a1"), chunk("a2"), chunk("shared")]
+    extra = [chunk("b1", 0.9), chunk("shared", 0.5)]
+    assert [c["id"] for c in merge_ranked([primary, extra], limit=10)] == ["a1", "b1", "a2", "shared"]
+
+
+def test_results_missing_a_dataset_are_marked_incomplete():
+    def search(dataset_id):
+        if dataset_id == "broken":
+            raise ConnectionError("unreachable")
+        return [chunk(f"{dataset_id}-1", 0.5)]
+
+    chunks, complete = asyncio.run(retrieve_datasets(["primary", "broken"], search, limit=5))
+    assert [c["id"] for c in chunks] == ["primary-1"] and not complete
+    chunks, complete = asyncio.run(retrieve_datasets(["primary", "extra"], search, limit=5))
+    assert len(chunks) == 2 and complete
@@ -0,0 +1,45 @@
+"""Answer sharing between clients must not mix up their RAGFlow conversations."""
+
+import asyncio
+
+
+def test_only_first_questions_are_shared(fake):
+    from chat import state as state_module
+    from chat.headless import new_state, run_background
+
+    question = "How does clover affect sward nitrogen?"
+    follow_up = "And in winter?"
+    first, second, third = (new_state(state_module.State, f"share-{name}") for name in "abc")
+
+    def ask(state, text):
+        return run_background(state, state_module.State.process_question, {"question": text}, on_update=lambda: None)
+
+    def session_questions(state):
+        session = state_module.session_manager.acquire(state._client_token())
+        return [message["content"] for message in fake.sessions[session.id]["messages"]]
+
+    async def run():
+        while state_module.document_catalog.records() is None:
+            await asyncio.sleep(0.05)
+        asks = fake.requests.get("ask", 0)
+
+        # Two fresh clients asking the same question share one generation.
+        await asyncio.gather(ask(first, question), ask(second, question))
+        assert fake.requests["ask"] == asks + 1
+        assert first.chats[first.current_chat][-1].answer == second.chats[second.current_chat][-1].answer
+
+        # A third fresh client is served from the cache.
+        await ask(third, question)
+        assert fake.requests["ask"] == asks + 1
+
+        # Follow-ups are never shared, and nothing extra is asked to catch a served session up.
+        await ask(second, follow_up)
+        assert fake.requests["ask"] == asks + 2
+        await ask(first, question)
+        assert fake.requests["ask"] == asks + 3
+
+        asked = sorted([session_questions(first), session_questions(second)])
+        assert asked == sorted([[question, question], [follow_up]])
+        assert session_questions(third) == []
+
+    asyncio.run(run())